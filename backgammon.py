@@ -0,0 +1,133 @@
+import sys
+
+# Entry point of the backgammon command. Each subcommand imports only the
+# modules it needs when it runs, so the headless ones never load pygame,
+# numpy or fonts, and worker processes that import this module start fast.
+
+USAGE = '''usage: backgammon [command] [options]
+
+commands:
+  gui        play in a window (the default)
+  headless   play games between two agents and print every turn
+  simulate   run a batch of self-play games and report the throughput
+  bench      time the engine and rendering hot paths
+  serve      host games for players connecting over the network
+  client     play a game hosted by backgammon serve in a window
+
+Run backgammon <command> --help for the options of a command.'''
+
+
+def gui(argv):
+    """Plays in a window."""
+    import main
+    main.main(argv)
+
+
+def simulate(argv):
+    """Runs a self-play batch."""
+    import simulation
+    simulation.main(argv)
+
+
+def bench(argv):
+    """Runs the benchmarks."""
+    import benchmark
+    benchmark.main(argv)
+
+
+def serve(argv):
+    """Runs the game server."""
+    import gameServer
+    gameServer.main(argv)
+
+
+def client(argv):
+    """Plays a game on a server in a window."""
+    import gameClient
+    gameClient.main(argv)
+
+
+def formatMove(start, end, player):
+    """Returns a checker move in the usual start/end notation, with points
+    numbered 1 to 24 from player's side and bar and off spelled out."""
+    import gameState
+
+    def name(slot):
+        if slot == gameState.BAR:
+            return 'bar'
+        if slot == gameState.OFF:
+            return 'off'
+        if player == gameState.RED:
+            return str(24 - slot)
+        return str(slot + 1)
+    return '%s/%s' % (name(start), name(end))
+
+
+def headless(argv):
+    """Plays games between two agents without a window, printing each turn's
+    roll and play and then the winner."""
+    import argparse
+    import gameRecord
+    import gnubgId
+    import simulation
+
+    parser = argparse.ArgumentParser(prog='backgammon headless',
+                                     description='Play games between two '
+                                     'agents without a window.')
+    parser.add_argument('--red', choices=sorted(simulation.AGENTS),
+                        default='greedy')
+    parser.add_argument('--white', choices=sorted(simulation.AGENTS),
+                        default='greedy')
+    parser.add_argument('--games', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='game i is played with seed + i')
+    parser.add_argument('--quiet', action='store_true',
+                        help='print only the winner of each game')
+    args = parser.parse_args(argv)
+
+    agents = (simulation.AGENTS[args.red](), simulation.AGENTS[args.white]())
+    colors = ('red', 'white')
+    encoder = gameRecord.GameEncoder()
+    for game in range(args.games):
+        result = simulation.playGame(agents, args.seed + game,
+                                     recorder=encoder)
+        if not args.quiet:
+            record = gameRecord.decodeGame(result.record)
+            turn = None
+            for event, state in gameRecord.replay(record):
+                if event[0] == gameRecord.ROLL:
+                    turn = ['%-5s %d%d:' % (colors[state.currentPlayer],
+                                            event[1], event[2])]
+                elif event[0] == gameRecord.MOVE:
+                    turn.append(formatMove(event[1], event[2],
+                                           state.currentPlayer))
+                else:
+                    print(' '.join(turn))
+                    print('      %s' % gnubgId.encode(state))
+            print(' '.join(turn))
+        print('game %d (seed %d): %s wins after %d turns' % (
+            game, result.seed, colors[result.winner], result.turns))
+
+
+COMMANDS = {'gui': gui, 'headless': headless, 'simulate': simulate,
+            'bench': bench, 'serve': serve, 'client': client}
+
+
+def main(argv=None):
+    """Runs the command named by the first argument with the rest."""
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in ('-h', '--help'):
+        print(USAGE)
+        return
+    if argv and argv[0] in COMMANDS:
+        command, argv = argv[0], argv[1:]
+    elif argv and not argv[0].startswith('-'):
+        sys.exit('backgammon: unknown command %r\n\n%s' % (argv[0], USAGE))
+    else:
+        command = 'gui'
+    COMMANDS[command](argv)
+
+
+if __name__ == '__main__':
+    main()
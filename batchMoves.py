@@ -0,0 +1,255 @@
+import numpy
+
+from gameState import BAR, OFF, CHECKERS, RED, WHITE
+
+# Batched counterpart of moveGeneration. Positions are rows of the first 26
+# slots of GameState.board: the signed counts of points 0-23 followed by the
+# red and white bar counts. Borne-off counts are not stored since they follow
+# from the number of checkers left on the board.
+#
+# Like moveGeneration, the work is done on positions seen from the player on
+# roll, where column i holds the checkers i + 1 pips from being borne off,
+# column 24 is the player's bar and column 25 the opponent's bar.
+WIDTH = 26
+REL_BAR = 24
+REL_OPP_BAR = 25
+
+
+def _players(players, count):
+    """Returns players as an array with one player index per position."""
+    if players is None:
+        players = RED
+    return numpy.broadcast_to(numpy.asarray(players, dtype=numpy.int8),
+                              (count,))
+
+
+def toRelative(positions, players=None):
+    """Converts an N x 26 array of positions to the view of the player on
+    roll in each row."""
+    positions = numpy.asarray(positions, dtype=numpy.int8)
+    players = _players(players, len(positions))
+    white = (players == WHITE)[:, None]
+    rel = numpy.empty((len(positions), WIDTH), dtype=numpy.int8)
+    rel[:, :24] = numpy.where(white, -positions[:, :24],
+                              positions[:, 23::-1])
+    rel[:, REL_BAR] = numpy.where(white[:, 0], positions[:, BAR + WHITE],
+                                  positions[:, BAR + RED])
+    rel[:, REL_OPP_BAR] = numpy.where(white[:, 0], positions[:, BAR + RED],
+                                      positions[:, BAR + WHITE])
+    return rel
+
+
+def fromRelative(rel, players=None):
+    """Converts an N x 26 array of relative positions back to the board
+    layout."""
+    rel = numpy.asarray(rel, dtype=numpy.int8)
+    players = _players(players, len(rel))
+    white = (players == WHITE)[:, None]
+    positions = numpy.empty((len(rel), WIDTH), dtype=numpy.int8)
+    positions[:, :24] = numpy.where(white, -rel[:, :24], rel[:, 23::-1])
+    positions[:, BAR + RED] = numpy.where(white[:, 0], rel[:, REL_OPP_BAR],
+                                          rel[:, REL_BAR])
+    positions[:, BAR + WHITE] = numpy.where(white[:, 0], rel[:, REL_BAR],
+                                            rel[:, REL_OPP_BAR])
+    return positions
+
+
+def _singleMoves(rel, dice, maxSource):
+    """Returns the row and source index of every legal single checker move of
+    dice[row] pips in the relative positions rel, along with the target
+    indices. Targets below 0 are bear-offs."""
+    count = len(rel)
+    own = rel[:, :24] > 0
+    onBar = rel[:, REL_BAR] > 0
+
+    sources = numpy.arange(24)
+    targets = sources[None, :] - dice[:, None]
+    landing = numpy.take_along_axis(rel[:, :24], numpy.maximum(targets, 0),
+                                    axis=1)
+    open_ = (targets >= 0) & (landing >= -1)
+
+    # A checker may be borne off once every checker is home, either with the
+    # exact number or with a larger one from the highest occupied point
+    home = ~onBar & ~own[:, 6:].any(axis=1)
+    top = 23 - numpy.argmax(own[:, ::-1], axis=1)
+    bearOff = home[:, None] & (targets < 0) & \
+        ((targets == -1) | (sources[None, :] == top[:, None]))
+
+    legal = own & (open_ | bearOff) & ~onBar[:, None] & \
+        (sources[None, :] <= maxSource[:, None])
+
+    # Checkers on the bar have to enter before anything else moves
+    entry = REL_BAR - dice
+    entryOpen = onBar & (rel[numpy.arange(count), entry] >= -1)
+
+    rows, columns = numpy.nonzero(numpy.concatenate(
+        (legal, entryOpen[:, None]), axis=1))
+    return rows, columns, columns - dice[rows]
+
+
+def _play(rel, rows, sources, targets):
+    """Returns copies of rel[rows] with one checker moved from sources to
+    targets in each row."""
+    children = rel[rows].copy()
+    index = numpy.arange(len(rows))
+    children[index, sources] -= 1
+    onBoard = targets >= 0
+    index = index[onBoard]
+    targets = targets[onBoard]
+    hit = children[index, targets] == -1
+    children[index[hit], targets[hit]] = 0
+    children[index[hit], REL_OPP_BAR] += 1
+    children[index, targets] += 1
+    return children
+
+
+# Place values that pack twelve 5-bit counts into one 64-bit integer
+_PLACES = 32 ** numpy.arange(12, dtype=numpy.int64)
+
+
+def _packRows(rel, parent):
+    """Packs each relative position and its parent index into three integers
+    that are equal exactly when the rows are, with the parent in the last
+    one. Counts fit in 5 bits once offset to be non-negative."""
+    fields = rel.astype(numpy.int64)
+    fields += CHECKERS
+    low = fields[:, :12] @ _PLACES
+    high = fields[:, 12:24] @ _PLACES
+    rest = fields[:, 24:] @ _PLACES[:2] + (parent << 10)
+    return low, high, rest
+
+
+def batchLegalPlays(positions, dice, players=None):
+    """Generates every legal play for N positions at once. positions is an
+    N x 26 integer array in the board layout, dice an N x 2 array of rolls
+    and players the player on roll in each row (red by default). Returns a
+    packed M x 26 array of the distinct positions reachable by a legal play
+    and an N + 1 array of offsets, so the successors of position i are
+    rows offsets[i]:offsets[i + 1]. Rows with no legal move get the
+    unchanged position as their only successor, as in moveGeneration."""
+    positions = numpy.asarray(positions, dtype=numpy.int8)
+    dice = numpy.asarray(dice, dtype=numpy.int64)
+    count = len(positions)
+    players = _players(players, count)
+    rel = toRelative(positions, players)
+    doubles = dice[:, 0] == dice[:, 1]
+
+    # Each frontier row plays its own sequence of numbers: both orders of a
+    # normal roll and four times the number of a double
+    parent = numpy.concatenate((numpy.arange(count),
+                                numpy.nonzero(~doubles)[0]))
+    first = numpy.concatenate((dice[:, 0], dice[~doubles, 1]))
+    second = numpy.concatenate((dice[:, 1], dice[~doubles, 0]))
+    sequences = numpy.stack((first, second, first, first), axis=1)
+    length = numpy.where(doubles[parent], 4, 2)
+
+    frontier = rel[parent]
+    maxSource = numpy.full(len(parent), REL_BAR)
+    leaves = []
+    for step in range(4):
+        playing = length > step
+        if not playing.all():
+            # Rows that used all their numbers are finished
+            done = ~playing
+            leaves.append((frontier[done], parent[done],
+                           numpy.full(done.sum(), step), sequences[done, 0]))
+            frontier = frontier[playing]
+            parent = parent[playing]
+            sequences = sequences[playing]
+            length = length[playing]
+            maxSource = maxSource[playing]
+        if not len(frontier):
+            break
+
+        die = sequences[:, step]
+        rows, sources, targets = _singleMoves(frontier, die, maxSource)
+
+        # Rows that cannot move at this step are finished as well
+        stuck = numpy.ones(len(frontier), dtype=bool)
+        stuck[rows] = False
+        leaves.append((frontier[stuck], parent[stuck],
+                       numpy.full(stuck.sum(), step), sequences[stuck, 0]))
+
+        frontier = _play(frontier, rows, sources, targets)
+        parent = parent[rows]
+        sequences = sequences[rows]
+        length = length[rows]
+        # With doubles, sources are kept non-increasing so that the same
+        # moves are not tried in several orders
+        maxSource = numpy.where(length == 4, sources, REL_BAR)
+    leaves.append((frontier, parent, numpy.full(len(frontier), 4),
+                   sequences[:, 0]))
+
+    leafRel = numpy.concatenate([leaf[0] for leaf in leaves])
+    leafParent = numpy.concatenate([leaf[1] for leaf in leaves])
+    used = numpy.concatenate([leaf[2] for leaf in leaves])
+    firstDie = numpy.concatenate([leaf[3] for leaf in leaves])
+
+    # As many dice as possible have to be used
+    mostUsed = numpy.zeros(count, dtype=numpy.int64)
+    numpy.maximum.at(mostUsed, leafParent, used)
+    keep = used == mostUsed[leafParent]
+
+    # If only one number of a normal roll can be used, it must be the larger
+    # one when possible
+    single = keep & (used == 1) & ~doubles[leafParent]
+    largest = numpy.zeros(count, dtype=numpy.int64)
+    numpy.maximum.at(largest, leafParent[single], firstDie[single])
+    keep &= ~single | (firstDie == largest[leafParent])
+
+    # Removes plays that lead to the same position, which also sorts the
+    # successors by their parent
+    leafRel = leafRel[keep]
+    leafParent = leafParent[keep]
+    keys = _packRows(leafRel, leafParent)
+    order = numpy.lexsort(keys)
+    sortedKeys = [key[order] for key in keys]
+    distinct = numpy.ones(len(order), dtype=bool)
+    distinct[1:] = numpy.logical_or.reduce(
+        [key[1:] != key[:-1] for key in sortedKeys])
+    order = order[distinct]
+    successorParent = leafParent[order]
+    successors = fromRelative(leafRel[order], players[successorParent])
+
+    offsets = numpy.zeros(count + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(successorParent, minlength=count),
+                 out=offsets[1:])
+    return successors, offsets
+
+
+def offCounts(positions):
+    """Returns an N x 2 array of the red and white borne-off counts implied
+    by an N x 26 array of positions."""
+    positions = numpy.asarray(positions, dtype=numpy.int64)
+    points = positions[:, :24]
+    red = numpy.where(points > 0, points, 0).sum(axis=1) + positions[:, BAR]
+    white = numpy.where(points < 0, -points, 0).sum(axis=1) + \
+        positions[:, BAR + WHITE]
+    return numpy.stack((CHECKERS - red, CHECKERS - white), axis=1)
+
+
+def applyMoves(positions, players, starts, ends):
+    """Applies one checker move per row to an N x 26 array of positions in
+    place, with starts and ends given as in GameState.moveChecker (so BAR and
+    OFF are allowed). Blots that are landed on are sent to the bar. The moves
+    are assumed to be legal."""
+    count = len(positions)
+    players = _players(players, count)
+    starts = numpy.asarray(starts)
+    ends = numpy.asarray(ends)
+    step = numpy.where(players == RED, 1, -1).astype(positions.dtype)
+    rows = numpy.arange(count)
+
+    fromBar = starts == BAR
+    positions[rows[fromBar], BAR + players[fromBar]] -= 1
+    positions[rows[~fromBar], starts[~fromBar]] -= step[~fromBar]
+
+    onBoard = ends != OFF
+    rows = rows[onBoard]
+    ends = ends[onBoard]
+    step = step[onBoard]
+    hit = positions[rows, ends] == -step
+    positions[rows[hit], ends[hit]] = 0
+    positions[rows[hit], BAR + 1 - players[onBoard][hit]] += 1
+    positions[rows, ends] += step
+    return positions
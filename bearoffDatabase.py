@@ -0,0 +1,240 @@
+import argparse
+import os
+import struct
+
+import numpy
+
+import gameState
+import moveGeneration
+
+# One-sided bear-off database. For every way of placing up to 15 checkers on
+# the six home points it holds the probability of needing exactly n turns to
+# bear them all off, assuming the player always makes the play that minimises
+# the expected number of turns.
+#
+# Positions are tuples of six counts, where index i holds the checkers i + 1
+# pips from being borne off. They are numbered in lexicographic order, so the
+# database needs no lookup table and can be used straight from the file.
+#
+# The file is a header followed by a (positions x turns) array of
+# little-endian uint16 probabilities scaled by 65535. It is memory-mapped when
+# loaded, so opening it is instant and processes share the pages.
+
+POINTS = 6
+MAX_CHECKERS = gameState.CHECKERS
+SCALE = 65535
+MAGIC = b'BGBO'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHI')
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'bearoff.db')
+
+
+def _combinations(n, k):
+    """Returns n choose k, or 0 when n < k."""
+    if n < k or n < 0:
+        return 0
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+# _CHOOSE[n][k] for every value positionIndex needs
+_CHOOSE = [[_combinations(n, k) for k in range(POINTS + 2)]
+           for n in range(MAX_CHECKERS + POINTS + 3)]
+
+
+def positionCount(maxCheckers=MAX_CHECKERS):
+    """Returns the number of positions with up to maxCheckers checkers."""
+    return _CHOOSE[maxCheckers + POINTS][POINTS]
+
+
+def positionIndex(counts, maxCheckers=MAX_CHECKERS):
+    """Returns the index of the six counts among all positions with up to
+    maxCheckers checkers in lexicographic order."""
+    index = 0
+    left = maxCheckers
+    for i in range(POINTS):
+        # Skips the positions with fewer checkers on this point. The ones
+        # with v checkers here number C(left - v + rest, rest), and the sum
+        # over v < counts[i] telescopes to a difference of two terms.
+        rest = POINTS - 1 - i
+        count = counts[i]
+        index += _CHOOSE[left + rest + 1][rest + 1] - \
+            _CHOOSE[left - count + rest + 1][rest + 1]
+        left -= count
+    return index
+
+
+def allPositions(maxCheckers=MAX_CHECKERS):
+    """Yields every position with up to maxCheckers checkers in index
+    order."""
+    def place(prefix, left):
+        if len(prefix) == POINTS:
+            yield tuple(prefix)
+            return
+        for count in range(left + 1):
+            prefix.append(count)
+            for position in place(prefix, left - count):
+                yield position
+            prefix.pop()
+    return place([], maxCheckers)
+
+
+def homeCounts(state, player=None):
+    """Returns the six home board counts of player in state, nearest the
+    edge of the board first."""
+    if player is None:
+        player = state.currentPlayer
+    board = state.board
+    if player == gameState.RED:
+        return tuple(max(board[23 - i], 0) for i in range(POINTS))
+    return tuple(max(-board[i], 0) for i in range(POINTS))
+
+
+def _successors(counts, dice):
+    """Returns the home counts reachable by each legal play of dice with no
+    opponent on the board."""
+    pos = list(counts) + [0] * (26 - POINTS)
+    plays = moveGeneration._relativePlays(pos,
+                                          moveGeneration.diceNumbers(dice))
+    return [key[:POINTS] for key in plays]
+
+
+def generate(path=DEFAULT_PATH, maxCheckers=MAX_CHECKERS, turns=None,
+             progress=None):
+    """Computes the database for up to maxCheckers checkers and writes it to
+    path. turns is the number of turns stored per position and defaults to
+    the longest bear-off with a non-zero scaled probability. progress, if
+    given, is called with the number of positions done so far."""
+    positions = list(allPositions(maxCheckers))
+    count = len(positions)
+    limit = 4 * maxCheckers + 2 #no bear-off can take longer than this
+    distributions = numpy.zeros((count, limit))
+    expected = numpy.zeros(count)
+    distributions[0, 0] = 1.0
+
+    # A play never adds pips, so positions are solved in order of pip count
+    # and every successor is already known when it is needed
+    order = sorted(range(1, count), key=lambda i: sum(
+        (point + 1) * n for point, n in enumerate(positions[i])))
+    for done, index in enumerate(order):
+        distribution = distributions[index]
+        for dice, probability in moveGeneration.ROLLS:
+            best = None
+            for successor in _successors(positions[index], dice):
+                successorIndex = positionIndex(successor, maxCheckers)
+                if best is None or \
+                        expected[successorIndex] < expected[best]:
+                    best = successorIndex
+            distribution[1:] += probability * distributions[best, :-1]
+        expected[index] = numpy.dot(numpy.arange(limit), distribution)
+        if progress is not None and not done % 1000:
+            progress(done)
+
+    scaled = numpy.rint(distributions * SCALE).astype('<u2')
+    if turns is None:
+        turns = int(numpy.nonzero(scaled.any(axis=0))[0][-1]) + 1
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, turns, maxCheckers, count))
+        f.write(numpy.ascontiguousarray(scaled[:, :turns]).tobytes())
+
+
+class BearoffDatabase:
+    """Read-only view of a generated bear-off database file."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, 'rb') as f:
+            magic, version, turns, maxCheckers, count = \
+                HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a bear-off database' % path)
+        self.path = path
+        self.turns = turns
+        self.maxCheckers = maxCheckers
+        self.table = numpy.memmap(path, dtype='<u2', mode='r',
+                                  offset=HEADER.size, shape=(count, turns))
+
+    def __getstate__(self):
+        # Worker processes map the file again rather than receiving a copy
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def contains(self, state, player=None):
+        """Returns True if player's position in state is in the database."""
+        if player is None:
+            player = state.currentPlayer
+        return state.isHome(player) and \
+            sum(homeCounts(state, player)) <= self.maxCheckers
+
+    def distribution(self, counts):
+        """Returns the probabilities of bearing the six counts off in exactly
+        0, 1, 2, ... turns, raising ValueError if the database does not hold
+        that many checkers."""
+        if sum(counts) > self.maxCheckers:
+            raise ValueError('%d checkers are more than the %d in %s'
+                             % (sum(counts), self.maxCheckers, self.path))
+        return self.table[positionIndex(counts, self.maxCheckers)] / SCALE
+
+    def expectedTurns(self, counts):
+        """Returns the expected number of turns to bear the counts off."""
+        return float(numpy.dot(numpy.arange(self.turns),
+                               self.distribution(counts)))
+
+    def winProbability(self, state):
+        """Returns the probability that the player on roll in state wins a
+        race where both players only have checkers in their home board."""
+        player = state.currentPlayer
+        mine = self.distribution(homeCounts(state, player))
+        theirs = self.distribution(homeCounts(state, 1 - player))
+        # The player on roll wins if they need no more turns than the
+        # opponent, so they win in n turns whenever the opponent needs n or
+        # more
+        theirsAtLeast = numpy.cumsum(theirs[::-1])[::-1]
+        return float(numpy.dot(mine, theirsAtLeast))
+
+    def bestPlay(self, state, dice):
+        """Returns the (play, resulting state) pair of legalPlays that gives
+        the player on roll the best chance of winning the race, or the
+        fewest expected turns if the opponent is not bearing off too.
+        Raises ValueError if the player on roll's position is not in the
+        database."""
+        player = state.currentPlayer
+        if not self.contains(state, player):
+            raise ValueError('the position of the player on roll is not in '
+                             'the bear-off database')
+        plays = moveGeneration.legalPlays(state, dice)
+        if self.contains(state, 1 - player):
+            def score(item):
+                result = item[1].copy()
+                if result.isWon(player):
+                    return 1.0
+                result.changeTurn()
+                return 1.0 - self.winProbability(result)
+        else:
+            def score(item):
+                return -self.expectedTurns(homeCounts(item[1], player))
+        return max(plays, key=score)
+
+
+def main(argv=None):
+    """Generates the database from the command line."""
+    parser = argparse.ArgumentParser(description='Generate the one-sided '
+                                     'bear-off database.')
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--checkers', type=int, default=MAX_CHECKERS)
+    args = parser.parse_args(argv)
+    total = positionCount(args.checkers)
+
+    def progress(done):
+        print('%d / %d positions' % (done, total))
+
+    generate(args.path, args.checkers, progress=progress)
+    print('Wrote %s' % args.path)
+
+
+if __name__ == '__main__':
+    main()
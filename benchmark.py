@@ -0,0 +1,375 @@
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# The benchmarks draw to an off-screen display, so they run without a window
+# or a display server. This has to happen before pygame is imported.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+import diceSource
+import evaluation
+import gameState
+import graphicalObjects
+import main as gui
+import moveGeneration
+import search
+
+# Benchmarks for the engine and rendering hot paths. Each one times a single
+# operation, such as generating the plays of one roll or redrawing the whole
+# board, called over and over in batches. A batch is sized to take about a
+# millisecond, and the time per call in each batch is one sample, so the
+# percentiles describe typical calls without the timer's overhead.
+#
+# Every benchmark is measured several times, in rounds through all of them so
+# a slow spell of the machine does not land on just one, and the fastest
+# measurement is kept. Noise from other work on the machine only ever slows
+# a measurement down, so the best of a few repeats varies less between
+# runs than any single one.
+#
+# Results can be saved as a JSON baseline and later runs compared with it,
+# flagging every benchmark whose rate dropped by more than a threshold.
+
+# Timing of one benchmark. Rates are calls a second and the percentiles are
+# seconds a call.
+BenchmarkResult = collections.namedtuple(
+    'BenchmarkResult', 'name opsPerSecond mean p50 p90 p99 calls')
+
+# Change in one benchmark between a baseline and a new run. change is the
+# fractional change in opsPerSecond, negative when it got slower.
+Comparison = collections.namedtuple('Comparison',
+                                    'name baseline current change regressed')
+
+# Benchmark factories in the order they run, keyed by name. A factory sets
+# up its fixtures and returns the operation to time.
+BENCHMARKS = collections.OrderedDict()
+
+_BATCH_TIME = 0.001 #target duration of one batch of calls in seconds
+
+
+def benchmark(name):
+    """Decorator that registers a factory under name in BENCHMARKS."""
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+def percentile(values, fraction):
+    """Returns the value at fraction through the sorted list values,
+    interpolating between neighbours."""
+    position = fraction * (len(values) - 1)
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def measure(name, operation, seconds=1.0, minSamples=5):
+    """Calls operation repeatedly for about seconds and returns its
+    BenchmarkResult. Slow operations still get minSamples calls."""
+    # Warms up caches and finds how many calls make up one batch
+    batch = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(batch):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= _BATCH_TIME:
+            break
+        batch *= 2
+
+    samples = []
+    total = 0.0
+    while total < seconds or len(samples) < minSamples:
+        start = time.perf_counter()
+        for _ in range(batch):
+            operation()
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed / batch)
+        total += elapsed
+
+    calls = batch * len(samples)
+    samples.sort()
+    return BenchmarkResult(name, calls / total, total / calls,
+                           percentile(samples, 0.5), percentile(samples, 0.9),
+                           percentile(samples, 0.99), calls)
+
+
+def _cycle(items):
+    """Returns a function that returns the items of a list in turn, starting
+    again after the last."""
+    iterator = iter(())
+    def nextItem():
+        nonlocal iterator
+        try:
+            return next(iterator)
+        except StopIteration:
+            iterator = iter(items)
+            return next(iterator)
+    return nextItem
+
+
+def samplePositions(count, seed=0):
+    """Returns count (state, dice) pairs from games of random play, so the
+    engine benchmarks see a realistic mix of positions."""
+    rng = random.Random(seed)
+    positions = []
+    state = gameState.GameState()
+    while len(positions) < count:
+        dice = (rng.randrange(1, 7), rng.randrange(1, 7))
+        positions.append((state, dice))
+        play, result = rng.choice(moveGeneration.legalPlays(state, dice))
+        if result.isWon(state.currentPlayer):
+            state = gameState.GameState()
+        else:
+            result.changeTurn()
+            state = result
+    return positions
+
+
+def _screen():
+    """Returns the off-screen display surface."""
+    if pygame.display.get_surface() is None:
+        pygame.display.init()
+        pygame.display.set_mode((gui.WIN_LENGTH, gui.WIN_HEIGHT))
+    return pygame.display.get_surface()
+
+
+def _clickPositions(board):
+    """Returns the middle of every point, the dice and the turn changer."""
+    positions = []
+    for point in board.points:
+        positions.append(point.triangle.getRect().center)
+    positions.append(board.dice.die1.getRect().center)
+    positions.append(board.turnchanger.getRect().center)
+    return positions
+
+
+@benchmark('legalPlays')
+def benchLegalPlays():
+    nextPosition = _cycle(samplePositions(500))
+    def operation():
+        state, dice = nextPosition()
+        moveGeneration.legalPlays(state, dice)
+    return operation
+
+
+@benchmark('applyPlay')
+def benchApplyPlay():
+    plays = []
+    for state, dice in samplePositions(500):
+        play, result = moveGeneration.legalPlays(state, dice)[0]
+        plays.append((state, play))
+    nextPlay = _cycle(plays)
+    def operation():
+        state, play = nextPlay()
+        state.copy().applyPlay(play)
+    return operation
+
+
+@benchmark('evaluate')
+def benchEvaluate():
+    evaluator = evaluation.HeuristicEvaluator()
+    nextPosition = _cycle([state for state, dice in samplePositions(500)])
+    def operation():
+        evaluator.evaluate(nextPosition())
+    return operation
+
+
+@benchmark('checkClick')
+def benchCheckClick():
+    board = gui.Board(_screen())
+    rng = random.Random(0)
+    positions = _clickPositions(board)
+    nextClick = _cycle([rng.choice(positions) for _ in range(5000)])
+    def operation():
+        if board.isGameWon():
+            board.loadState(gameState.GameState())
+        board.checkClick(nextClick())
+    return operation
+
+
+@benchmark('drawBoard')
+def benchDrawBoard():
+    board = gui.Board(_screen())
+    return board.drawBoard
+
+
+@benchmark('Text.draw')
+def benchTextDraw():
+    screen = _screen()
+    text = graphicalObjects.Text('It\'s white\'s turn!', (20, 60), 12,
+                                 gui.WHITE)
+    def operation():
+        text.draw(screen)
+    return operation
+
+
+@benchmark('Circle.checkClick')
+def benchCircleCheckClick():
+    circle = graphicalObjects.Circle(gui.RED, (100, 100), gui.C1_RADIUS)
+    rng = random.Random(0)
+    nextPosition = _cycle([(rng.randrange(60, 140), rng.randrange(60, 140))
+                           for _ in range(1000)])
+    def operation():
+        circle.checkClick(nextPosition())
+    return operation
+
+
+@benchmark('scriptedGame')
+def benchScriptedGame():
+    # Both sides are played by the computer through the same board methods
+    # clicks use, choosing plays by static evaluation so every game is the
+    # same whatever the machine's speed
+    board = gui.Board(_screen(), computerPlayers=(0, 1))
+    for player in board.players:
+        player.search = search.ExpectiminimaxSearch(maxDepth=1)
+    def operation():
+        board.dice.source = diceSource.SeededDice(0)
+        board.loadState(gameState.GameState())
+        while not board.isGameWon():
+            board.players[board.getCurrentPlayer()].takeTurn()
+    return operation
+
+
+def runBenchmarks(names=None, seconds=1.0, progress=None, repeats=5):
+    """Runs the benchmarks in names, or all of them, and returns their
+    BenchmarkResults. Each is measured for seconds repeats times and its
+    fastest measurement kept. progress, if given, is called with each
+    result."""
+    if names is None:
+        names = list(BENCHMARKS)
+    operations = [(name, BENCHMARKS[name]()) for name in names]
+    results = [None] * len(operations)
+    for repeat in range(repeats):
+        for i, (name, operation) in enumerate(operations):
+            result = measure(name, operation, seconds)
+            if results[i] is None or \
+               result.opsPerSecond > results[i].opsPerSecond:
+                results[i] = result
+            if repeat == repeats - 1 and progress is not None:
+                progress(results[i])
+    return results
+
+
+def environment():
+    """Returns a description of the machine and versions the benchmarks ran
+    on, saved with a baseline."""
+    return {'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'platform': platform.platform(),
+            'machine': platform.machine()}
+
+
+def saveBaseline(path, results):
+    """Writes results to path as a JSON baseline."""
+    data = {'environment': environment(),
+            'results': dict((result.name, result._asdict())
+                            for result in results)}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def loadBaseline(path):
+    """Returns the BenchmarkResults saved in the baseline at path, keyed by
+    name."""
+    with open(path) as f:
+        data = json.load(f)
+    return dict((name, BenchmarkResult(**fields))
+                for name, fields in data['results'].items())
+
+
+def compare(baseline, results, threshold=0.3):
+    """Returns a Comparison for every result that has a baseline. A result
+    regressed if its rate fell by more than the fraction threshold. The
+    default allows for the spread between whole runs on a busy machine,
+    where even the best of several repeats can be a quarter slower than the
+    run before; on a quiet machine a smaller threshold catches more."""
+    comparisons = []
+    for result in results:
+        old = baseline.get(result.name)
+        if old is None:
+            continue
+        change = result.opsPerSecond / old.opsPerSecond - 1.0
+        comparisons.append(Comparison(result.name, old.opsPerSecond,
+                                      result.opsPerSecond, change,
+                                      change < -threshold))
+    return comparisons
+
+
+def _formatTime(seconds):
+    """Returns a duration with a unit that suits its size."""
+    if seconds < 1e-3:
+        return '%.2fus' % (seconds * 1e6)
+    if seconds < 1.0:
+        return '%.2fms' % (seconds * 1e3)
+    return '%.2fs' % seconds
+
+
+def formatResult(result):
+    """Returns a one-line description of a BenchmarkResult."""
+    return '%-18s %12.1f ops/s  p50 %9s  p90 %9s  p99 %9s' % (
+        result.name, result.opsPerSecond, _formatTime(result.p50),
+        _formatTime(result.p90), _formatTime(result.p99))
+
+
+def formatComparison(comparison):
+    """Returns a one-line description of a Comparison."""
+    return '%-18s %12.1f -> %12.1f ops/s %+7.1f%%%s' % (
+        comparison.name, comparison.baseline, comparison.current,
+        100.0 * comparison.change,
+        '  REGRESSION' if comparison.regressed else '')
+
+
+def main(argv=None):
+    """Runs the benchmarks from the command line. Exits with status 1 if a
+    comparison finds a regression."""
+    parser = argparse.ArgumentParser(description='Time the engine and '
+                                     'rendering hot paths without a display.')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks to run (default: all of %s)'
+                        % ', '.join(BENCHMARKS))
+    parser.add_argument('--seconds', type=float, default=1.0,
+                        help='time to spend on each measurement')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='measurements of each benchmark, of which the '
+                        'fastest is kept')
+    parser.add_argument('--save', default=None,
+                        help='write the results to this JSON baseline')
+    parser.add_argument('--compare', default=None,
+                        help='compare the results with this JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.3,
+                        help='slowdown, as a fraction, that counts as a '
+                        'regression')
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %r' % name)
+
+    if args.repeats < 1:
+        parser.error('--repeats must be at least 1')
+
+    results = runBenchmarks(args.names or None, args.seconds,
+                            lambda result: print(formatResult(result)),
+                            args.repeats)
+    if args.save:
+        saveBaseline(args.save, results)
+        print('Saved baseline to %s' % args.save)
+    if args.compare:
+        comparisons = compare(loadBaseline(args.compare), results,
+                              args.threshold)
+        print()
+        for comparison in comparisons:
+            print(formatComparison(comparison))
+        if any(comparison.regressed for comparison in comparisons):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import pygame
 import graphicalObjects
-import random
+import gameState
+import diceSource
 
 # Board dimension constants
 WIN_LENGTH = 900
@@ -22,6 +23,22 @@ BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 
+# Checker images keyed by color, shared by every checker of that color
+_checkerImages = {}
+
+
+def checkerImage(color):
+    """Returns the transparent image of a checker of color, drawing it the
+    first time it is asked for."""
+    image = _checkerImages.get(color)
+    if image is None:
+        image = pygame.Surface((2 * C1_RADIUS + 1, 2 * C1_RADIUS + 1),
+                               pygame.SRCALPHA)
+        graphicalObjects.Circle(color, (C1_RADIUS, C1_RADIUS),
+                                C1_RADIUS).draw(image)
+        _checkerImages[color] = image
+    return image
+
 
 class Bar:
     """Class for the bar area of the board."""
@@ -47,6 +64,10 @@ class Bar:
         """Draws the bar to the surface."""
         self.bar.draw(surface)
 
+    def getRect(self):
+        """Returns the screen area of the bar and its checkers."""
+        return self.bar.getRect()
+
     def drawCheckers(self, surface):
         """Draws each checker on the bar to the surface."""
         for checker in self.checkers:
@@ -61,12 +82,17 @@ class Bar:
         self.checkers.append(checker)
       
     def returnChecker(self):
-        """Returns the bottom-most checker from the bar."""
-        return self.checkers[0]
+        """Returns the top-most checker from the bar."""
+        return self.checkers[-1]
    
     def removeChecker(self):
-        """Removes the top-most checker from Point"""
-        self.checkers.pop(0)
+        """Removes the top-most checker from the bar, so the checkers below
+        it keep their places."""
+        self.checkers.pop()
+
+    def clearCheckers(self):
+        """Removes every checker from the bar."""
+        self.checkers = []
  
     def isEmpty(self):
         """Returns True if bar is empty and False if otherwise."""
@@ -88,8 +114,14 @@ class Bar:
                 - .5 * B_HEIGHT + C1_RADIUS + (i % 5) * 2 * C1_RADIUS)))
 
     def update(self):
-        """Updates the self.empty attribute."""
-        self.empty = not len(self.checkers)
+        """Updates the self.empty attribute from the board's game state."""
+        self.empty = not self.board.state.barCount(self.getPlayerIndex())
+
+    def getPlayerIndex(self):
+        """Returns the player index corresponding to the bar's team."""
+        if self.team == RED:
+            return gameState.RED
+        return gameState.WHITE
 
     def setActiveTurn(self):
         """Makes piece active if it's checkers correspond to the active team."""
@@ -115,12 +147,16 @@ class CheckerBox:
         """Draws the checker box to the surface."""
         self.box.draw(surface)
 
+    def getRect(self):
+        """Returns the screen area of the box and its checkers."""
+        return self.box.getRect()
+
     def drawCheckers(self, surface):
         """Draws each of the checkers on the checker box to the surface."""
         for checker in self.whiteCheckers:
-            checker.draw(self.surface)
+            checker.draw(surface)
         for checker in self.redCheckers:
-            checker.draw(self.surface)
+            checker.draw(surface)
 
     def addChecker(self, checker):
         """Adds checker to appropriate side in the bar."""
@@ -131,7 +167,9 @@ class CheckerBox:
             checker.moveTo((int((WIN_CENTER[0] + (B_WIDTH + 40) / 2 + T_WIDTH)),\
             int(WIN_CENTER[1] - C1_RADIUS - (len(self.redCheckers) - 1) * \
             C1_RADIUS / 1.5)))
-            self.redCheckers.append(checker)
+            # The red stack is drawn over the white one, which it can reach,
+            # so its layers start above every white checker's
+            checker.setLayer(len(self.redCheckers) + gameState.CHECKERS)
         
         # Adds white checker to white side
         else:
@@ -139,16 +177,27 @@ class CheckerBox:
             checker.moveTo((int((WIN_CENTER[0] + (B_WIDTH + 40) / 2 + T_WIDTH)),\
             int(WIN_CENTER[1] - C1_RADIUS + B_HEIGHT/2 - (len(self.whiteCheckers)\
             - 1) * C1_RADIUS / 1.5)))
-            self.whiteCheckers.append(checker)
+            checker.setLayer(len(self.whiteCheckers))
+
+    def clearCheckers(self):
+        """Removes every checker from the box."""
+        self.redCheckers = []
+        self.whiteCheckers = []
 
 
 class Dice:
     """A graphical object that rolls when clicked."""
 
-    def __init__(self, board, surface):
+    def __init__(self, board, surface, source=None):
 
         self.board = board
 
+        # Where the rolls come from, by default a generator seeded from the
+        # system
+        if source is None:
+            source = diceSource.SeededDice()
+        self.source = source
+
         self.die1 = graphicalObjects.Rectangle(SIDE, SIDE, (WIN_CENTER[0] + 40, WIN_CENTER[1]), WHITE)
         self.die2 = graphicalObjects.Rectangle(SIDE, SIDE, (WIN_CENTER[0] + 80, WIN_CENTER[1]), WHITE)
 
@@ -170,12 +219,22 @@ class Dice:
         self.die1_face.draw(surface)
         self.die2_face.draw(surface)
 
+    def getRect(self):
+        """Returns the screen area of both dice."""
+        return self.die1.getRect().union(self.die2.getRect())
+
     def checkClick(self, pos):
         """Given the mouse position, checkes whether a player has clicked
            on the dice."""
         if self.die1.checkClick(pos) or self.die2.checkClick(pos):
             self.handleMouseRelease()
 
+    def addHitArea(self, grid):
+        """Adds the dice to the HitGrid grid."""
+        widgetId = grid.addWidget(self)
+        self.die1.addHitArea(grid, widgetId)
+        self.die2.addHitArea(grid, widgetId)
+
     def handleMouseRelease(self):
         """Instructs the dice to roll when clicked."""
         self.roll()
@@ -184,15 +243,25 @@ class Dice:
         """Rolls both die. Updates the number values accordingly and sets the
            active variable to false."""
         if self.active:
-            self.die1_num = random.randrange(1, 7)
+            self.die1_num, self.die2_num = self.source.roll()
             self.die1_face.setText(str(self.die1_num))
-            self.die2_num = random.randrange(1, 7)
             self.die2_face.setText(str(self.die2_num))
+            self.board.recordRoll(self.die1_num, self.die2_num)
             self.active = False
             self.board.getDiceNumbers()
             self.board.possibleBarMoves()
-            self.draw(self.surface)
-            pygame.display.flip()
+            self.board.pushHistory()
+            self.board.markDirty(self.getRect())
+            self.board.updateDisplay()
+
+    def show(self, die1, die2):
+        """Shows a roll made elsewhere, such as by a game server, as if the
+           dice had rolled it, without sending it to the recorder."""
+        self.die1_num, self.die2_num = die1, die2
+        self.die1_face.setText(str(die1))
+        self.die2_face.setText(str(die2))
+        self.active = False
+        self.board.markDirty(self.getRect())
 
     def getNumbers(self):
         """Returns the number of both die faces as a tuple."""
@@ -244,6 +313,12 @@ class Point:
             self.triangle = graphicalObjects.Triangle(self.color, ((x, y), (x + T_WIDTH, y),
                                                   (x + T_WIDTH/2, y + T_HEIGHT)), side)
 
+        # Images of the triangle with each highlighted border, drawn over the
+        # board's static layer
+        self.highlights = {}
+        for border in ((YELLOW, 3), (RED, 3)):
+            self.highlights[border] = self.triangle.renderImage(*border)
+
         self.checkers = []
         self.open = True #True if point contains no checkers
         self.blot = False #True if point contains only one checker
@@ -257,10 +332,39 @@ class Point:
         if self.triangle.checkClick(pos):
             self.handleMouseRelease()
 
+    def addHitArea(self, grid):
+        """Adds the point to the HitGrid grid."""
+        self.triangle.addHitArea(grid, grid.addWidget(self))
+
     def draw(self, surface):
         """Draws Triangle to screen."""
         self.triangle.draw(surface)
 
+    def isHighlighted(self):
+        """Returns True if the point's border differs from the plain one in
+        the board's static layer."""
+        return self.triangle.getBorder() != (BLACK, 1)
+
+    def drawHighlight(self, surface):
+        """Draws the triangle with its highlighted border from a cached
+        image."""
+        border = self.triangle.getBorder()
+        if border not in self.highlights:
+            self.highlights[border] = self.triangle.renderImage(*border)
+        image, rect = self.highlights[border]
+        surface.blit(image, rect)
+
+    def getRect(self):
+        """Returns the screen area of the triangle and the tallest stack of
+        checkers it can hold."""
+        stack = 10 * C1_RADIUS
+        if self.side == 'bottom':
+            rect = pygame.Rect(self.x - T_WIDTH, self.y - stack, T_WIDTH,
+                               stack)
+        else:
+            rect = pygame.Rect(self.x, self.y, T_WIDTH, stack)
+        return rect.union(self.triangle.getRect())
+
     def drawCheckers(self, surface):
         """Draws the checkers to the surface."""
         for checker in self.checkers:
@@ -310,6 +414,12 @@ class Point:
         self.clicked = True
         self.setBorder(YELLOW, 3)
         self.board.possibleMoves(self.number)
+
+    def reset(self):
+        """Clears any click or possible move shown on the point."""
+        self.clicked = False
+        self.isValidMove = False
+        self.setBorder(BLACK, 1)
     
     def checkersAmount(self):
         """Returns the number of checkers that are on the piece."""
@@ -320,12 +430,17 @@ class Point:
         self.checkers.append(checker)
     
     def removeChecker(self):
-        """Removes the top-most checker from Point"""
-        self.checkers.pop(0)
+        """Removes the top-most checker from Point, so the checkers below it
+        keep their places."""
+        self.checkers.pop()
+
+    def clearCheckers(self):
+        """Removes every checker from Point."""
+        self.checkers = []
     
     def returnChecker(self):
-        """Returns the bottom-most checker on the piece."""
-        return self.checkers[0]
+        """Returns the top-most checker on the piece."""
+        return self.checkers[-1]
     
     def isOpen(self):
         """Returns True if point is open and false if otherwise."""
@@ -357,7 +472,7 @@ class Point:
     def setBorder(self, color, width):
         """Sets the border color and width of point."""
         self.triangle.setBorder(color, width)
-        self.board.drawBoard()
+        self.board.markDirty(self.getRect())
         
     def organize(self):
         """Stacks each Checker that belongs to Point so that they all lie in a
@@ -374,17 +489,16 @@ class Point:
                                           + (i % 5) * 2 * C1_RADIUS)))
     
     def update(self):
-        """Updates important attributes of Point. Should be called at the end
-        of each turn."""
-        self.open = not len(self.checkers)
-        if len(self.checkers) == 1:
-            self.blot = True
-        else:
-            self.blot = False
-        if len(self.checkers) != 0:
-            self.team = self.checkers[0].getColor()
-        else:
+        """Updates important attributes of Point from the board's game state.
+        Should be called at the end of each turn."""
+        state = self.board.state
+        self.open = state.isOpen(self.number)
+        self.blot = state.isBlot(self.number)
+        owner = state.owner(self.number)
+        if owner is None:
             self.team = None
+        else:
+            self.team = self.board.players[owner].getColor()
     
     def setActiveTurn(self):
         """Makes piece active if it's checkers correspond to the active team."""
@@ -410,23 +524,29 @@ class Point:
         return self.number
 
 
-class Checker:
-    """Class for the checker pieces. This class is not interractive."""
+class Checker(pygame.sprite.DirtySprite):
+    """Class for the checker pieces. This class is not interractive. Checkers
+    are sprites sharing one image per color, and are only redrawn by their
+    group after they move."""
 
     def __init__(self, color):
+        pygame.sprite.DirtySprite.__init__(self)
 
         self.color = color
         self.center = (0, 0)
-        self.checker = graphicalObjects.Circle(self.color, self.center, C1_RADIUS)
+        self.image = checkerImage(color)
+        self.rect = self.image.get_rect(center=self.center)
 
-    def checkClick(self, surface):
+    def checkClick(self, pos):
         """Given the mouse position, checks whether a player has clicked
            on the checker."""
-        return self.checker.checkClick(surface)
+        dx = pos[0] - self.center[0]
+        dy = pos[1] - self.center[1]
+        return dx * dx + dy * dy < C1_RADIUS * C1_RADIUS
 
     def draw(self, surface):
         """Draws Checker to surface"""
-        self.checker.draw(surface)
+        surface.blit(self.image, self.rect)
 
     def getColor(self):
         """Returns the color of Checker"""
@@ -440,7 +560,19 @@ class Checker:
 
     def moveTo(self, center):
         """Moves Checker so it is centered at the given center"""
-        self.checker.moveTo(center)
+        if center != self.center:
+            self.center = center
+            self.rect = self.image.get_rect(center=center)
+            self.dirty = 1
+
+    def setLayer(self, layer):
+        """Sets the drawing layer of the checker, so checkers on higher
+        layers are drawn over lower ones."""
+        groups = self.groups()
+        if not groups:
+            self._layer = layer
+        for group in groups:
+            group.change_layer(self, layer)
 
 
 class TurnChanger:
@@ -463,11 +595,25 @@ class TurnChanger:
         self.text2.draw(surface)
         self.text3.draw(surface)
 
+    def getRect(self):
+        """Returns the screen area of the button and its labels."""
+        return self.button.getRect().unionall(
+            [self.text1.getRect(), self.text2.getRect(),
+             self.text3.getRect()])
+
     def checkClick(self, pos):
         """Given the mouse postion, checks whether a player has clicked
            on the turn changer."""
         if self.button.checkClick(pos):
-            self.board.changeTurn()
+            self.handleMouseRelease()
+
+    def handleMouseRelease(self):
+        """Changes the turn when the button is clicked."""
+        self.board.changeTurn()
+
+    def addHitArea(self, grid):
+        """Adds the button to the HitGrid grid."""
+        self.button.addHitArea(grid, grid.addWidget(self))
 
     def setFillColor(self, color):
         """Sets the fill color to the turn changer button to color."""
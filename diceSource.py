@@ -0,0 +1,106 @@
+import random
+
+import gameRecord
+
+# Sources of dice rolls. The GUI's dice and the headless simulation both take
+# their rolls from a DiceSource, so a game can be reproduced from a seed,
+# replayed roll for roll from a record, or fed from large pre-generated
+# blocks when only speed matters.
+
+
+class DiceExhausted(Exception):
+    """Raised when a ReplayDice has no rolls left and nothing to fall back
+    on."""
+    pass
+
+
+class DiceSource:
+    """Base class for dice sources."""
+
+    def roll(self):
+        """Returns the next roll as a (die1, die2) tuple."""
+        raise NotImplementedError
+
+
+class SeededDice(DiceSource):
+    """Rolls from a generator of its own, so the same seed always gives the
+    same rolls whatever else uses the random module. With seed None it is
+    seeded from the system, like the random module."""
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def roll(self):
+        randrange = self.random.randrange
+        return (randrange(1, 7), randrange(1, 7))
+
+
+class NumpyDice(DiceSource):
+    """Rolls from a NumPy generator, which makes a whole block of rolls in
+    one call and hands them out one at a time. seed can be anything NumPy
+    accepts, including a SeedSequence."""
+
+    def __init__(self, seed=None, blockSize=1 << 16):
+        # numpy is only needed here, so the GUI does not import it for dice
+        import numpy
+        self.generator = numpy.random.default_rng(seed)
+        self.blockSize = blockSize
+        self.block = []
+        self.position = 0
+
+    @classmethod
+    def streams(cls, seed, count, blockSize=1 << 16):
+        """Returns count sources with independent streams derived from seed,
+        such as one for each worker process."""
+        import numpy
+        return [cls(child, blockSize)
+                for child in numpy.random.SeedSequence(seed).spawn(count)]
+
+    def refill(self):
+        """Generates the next block of rolls."""
+        self.block = self.generator.integers(1, 7, 2 * self.blockSize,
+                                             dtype='uint8').tolist()
+        self.position = 0
+
+    def roll(self):
+        position = self.position
+        if position == len(self.block):
+            self.refill()
+            position = 0
+        self.position = position + 2
+        return (self.block[position], self.block[position + 1])
+
+
+class ReplayDice(DiceSource):
+    """Plays back a list of rolls in order. Once they run out, rolls come
+    from the source then, or DiceExhausted is raised if there is none."""
+
+    def __init__(self, rolls, then=None):
+        self.rolls = list(rolls)
+        self.position = 0
+        self.then = then
+
+    @classmethod
+    def fromRecord(cls, record, then=None):
+        """Returns a source replaying the rolls of a gameRecord.GameRecord."""
+        return cls([(event[1], event[2]) for event in record.events
+                    if event[0] == gameRecord.ROLL], then)
+
+    def remaining(self):
+        """Returns the number of recorded rolls not yet played back."""
+        return len(self.rolls) - self.position
+
+    def roll(self):
+        if self.position < len(self.rolls):
+            self.position += 1
+            return self.rolls[self.position - 1]
+        if self.then is None:
+            raise DiceExhausted('all %d rolls have been replayed'
+                                % len(self.rolls))
+        return self.then.roll()
+
+
+# Kinds of dice a self-play batch can be played with: SeededDice for each
+# game, or a NumpyDice stream for each chunk of games
+KINDS = ('seeded', 'numpy')
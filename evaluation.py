@@ -0,0 +1,83 @@
+import math
+
+from gameState import BAR, HOME_MASK, RED, WHITE, bitCount
+
+# Evaluators score a position for the player on roll, before they roll, as an
+# equity between -1 (certain loss) and 1 (certain win). Gammons are not
+# counted.
+LOSS = -1.0
+WIN = 1.0
+
+
+class Evaluator:
+    """Base class for position evaluators."""
+
+    def evaluate(self, state):
+        """Returns the equity of the player on roll in state."""
+        raise NotImplementedError
+
+    def evaluateMany(self, states):
+        """Returns the equities of a list of positions. Evaluators that can
+        score many positions faster at once override this."""
+        return [self.evaluate(state) for state in states]
+
+
+def terminalValue(state):
+    """Returns the equity of the player on roll if the game in state is over,
+    or None otherwise."""
+    winner = state.winner()
+    if winner is None:
+        return None
+    if winner == state.currentPlayer:
+        return WIN
+    return LOSS
+
+
+def isRace(state):
+    """Returns True if the players' checkers can no longer meet."""
+    board = state.board
+    if board[BAR + RED] or board[BAR + WHITE]:
+        return False
+    # Red moves up the board and white down it, so it is a race once no white
+    # checker is on or above the rearmost red one. The lowest set bit of red's
+    # mask is that checker's point, and subtracting one from it gives the
+    # mask of the points below.
+    red = state.occupiedMask(RED)
+    return not state.occupiedMask(WHITE) & ~((red & -red) - 1)
+
+
+class HeuristicEvaluator(Evaluator):
+    """Hand-tuned evaluator using the race, blots, made home board points and
+    checkers on the bar. If given a BearoffDatabase, bear-offs are scored
+    exactly."""
+
+    def __init__(self, bearoff=None):
+        self.bearoff = bearoff
+
+    def evaluate(self, state):
+        value = terminalValue(state)
+        if value is not None:
+            return value
+
+        player = state.currentPlayer
+        opponent = 1 - player
+        if self.bearoff is not None and self.bearoff.contains(state) and \
+                self.bearoff.contains(state, opponent):
+            return 2.0 * self.bearoff.winProbability(state) - 1.0
+
+        mine = state.pipCount(player)
+        theirs = state.pipCount(opponent)
+        # Being on roll is worth about 8 pips, and a pip matters more as the
+        # race gets shorter
+        score = (theirs - mine + 8) / max(0.1 * (mine + theirs), 10.0)
+        if isRace(state):
+            return math.tanh(score)
+
+        score -= 0.15 * bitCount(state.blotMask(player))
+        score += 0.05 * bitCount(state.blotMask(opponent))
+        score += 0.1 * bitCount(state.madeMask(player) & HOME_MASK[player])
+        score -= 0.1 * bitCount(state.madeMask(opponent) &
+                                HOME_MASK[opponent])
+        board = state.board
+        score += 0.25 * (board[BAR + opponent] - board[BAR + player])
+        return math.tanh(score)
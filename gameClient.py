@@ -0,0 +1,232 @@
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+
+import pygame
+
+import diceSource
+import gameServer
+import gameState
+import main as gui
+
+# Thin client that plays one game on a gameServer through the usual window.
+# The Board still runs its own rules so clicks are answered at once, but the
+# server decides: its rolls come in through RemoteDice, every move the board
+# makes is sent on by ServerRecorder, and whenever the server's state differs
+# from the board's, the board is reloaded from it. The opponent's moves reach
+# the board the same way.
+#
+# A thread reads the server's messages and posts them to the pygame event
+# queue as SERVER_EVENTs with the message as their message attribute. Nothing
+# waits on the server: clicking the dice only asks it to roll, and the roll is
+# played when the reply comes in through the event queue like any other
+# message, so the window keeps responding however slow the server is.
+
+SERVER_EVENT = pygame.USEREVENT + 1
+ROLL_TIMEOUT = 5.0 #seconds to wait for the server to roll
+
+
+class RollPending(Exception):
+    """Raised by RemoteDice.roll while the server has still to answer the
+    roll asked for. The board is left as it was."""
+    pass
+
+
+class Connection:
+    """Line-delimited JSON connection to a gameServer."""
+
+    def __init__(self, host=gameServer.DEFAULT_HOST,
+                 port=gameServer.DEFAULT_PORT):
+        self.socket = socket.create_connection((host, port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def send(self, message):
+        """Sends message to the server."""
+        self.socket.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+    def read(self):
+        """Reads messages until the server disconnects, then posts a closed
+        message."""
+        for line in self.socket.makefile('rb'):
+            message = json.loads(line)
+            pygame.event.post(pygame.event.Event(SERVER_EVENT,
+                                                 message=message))
+        pygame.event.post(pygame.event.Event(SERVER_EVENT,
+                                             message={'type': 'closed'}))
+
+    def close(self):
+        """Closes the connection."""
+        self.socket.close()
+
+
+class RemoteDice(diceSource.DiceSource):
+    """Dice rolled by the server. The first roll asks the server to roll and
+    raises RollPending. Once the reply arrives, deliver hands it over and
+    the next roll returns it. requested is the time the outstanding request
+    was sent, or None."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.requested = None
+        self.reply = None
+
+    def roll(self):
+        if self.reply is not None:
+            reply, self.reply = self.reply, None
+            return reply
+        if self.requested is None:
+            self.connection.send({'type': 'roll'})
+            self.requested = time.monotonic()
+        raise RollPending()
+
+    def deliver(self, dice):
+        """Keeps the server's roll for the next call of roll."""
+        self.requested = None
+        self.reply = tuple(dice)
+
+    def refused(self):
+        """Forgets the request the server refused, so the dice can be
+        clicked again."""
+        self.requested = None
+
+    def timedOut(self):
+        """Returns True, and forgets the request, if the server has not
+        answered it within ROLL_TIMEOUT."""
+        if self.requested is not None and \
+           time.monotonic() - self.requested > ROLL_TIMEOUT:
+            self.requested = None
+            return True
+        return False
+
+
+class ServerRecorder:
+    """Stands in for the board's recorder, sending its moves to the server.
+    A change of turn asks for the server's state, since the server ends
+    turns by itself and the board is reloaded if it passed too early."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def startGame(self, state=None):
+        pass
+
+    def roll(self, die1, die2):
+        pass
+
+    def move(self, start, end):
+        self.connection.send({'type': 'move', 'start': start, 'end': end})
+
+    def changeTurn(self):
+        self.connection.send({'type': 'state'})
+
+    def endGame(self, winner=None):
+        pass
+
+    def mark(self):
+        return 0
+
+    def rewind(self, mark):
+        pass
+
+
+def applyState(board, message):
+    """Makes board show the game in a state message from the server,
+    reloading it only if it differs from what the board shows already."""
+    state = gameState.GameState(message['board'], message['player'])
+    numbers = sorted(message['numbers'])
+    if state == board.state and numbers == sorted(board.diceNumbers) and \
+       message['rolled'] == (not board.dice.isActive()):
+        return
+    if message['rolled']:
+        board.showState(state, message['dice'], message['numbers'])
+    else:
+        board.showState(state)
+    if message['winner'] is not None:
+        board.checkWinner(board.surface)
+
+
+def applyRoll(board, message):
+    """Plays the roll the server answered the dice's request with. If a state
+    message has already shown it, the board has nothing left to roll and the
+    reply is dropped."""
+    source = board.dice.source
+    source.deliver(message['dice'])
+    board.dice.roll()
+    source.reply = None
+
+
+def main(argv=None):
+    """Plays one game on a server in a window."""
+    parser = argparse.ArgumentParser(description='Play a game on a '
+                                     'backgammon server.')
+    parser.add_argument('--host', default=gameServer.DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=gameServer.DEFAULT_PORT)
+    parser.add_argument('--create', action='store_true',
+                        help='start a new game as red and wait for an '
+                        'opponent')
+    parser.add_argument('--game', type=int, default=None,
+                        help='join this game as white (default: any game '
+                        'waiting for an opponent)')
+    args = parser.parse_args(argv)
+
+    screen = pygame.display.set_mode((gui.WIN_LENGTH, gui.WIN_HEIGHT))
+    try:
+        connection = Connection(args.host, args.port)
+    except OSError as error:
+        sys.exit('cannot connect to %s:%d: %s' % (args.host, args.port, error))
+    dice = RemoteDice(connection)
+    board = gui.Board(screen, recorder=ServerRecorder(connection), dice=dice)
+    if args.create:
+        connection.send({'type': 'create'})
+    else:
+        connection.send({'type': 'join', 'game': args.game})
+
+    # Seat taken, None until the server has answered
+    player = None
+    running = True
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+    while running:
+        event = pygame.event.wait(gui.IDLE_TIMEOUT)
+        if event.type == pygame.QUIT:
+            running = False
+        elif event.type == SERVER_EVENT:
+            message = event.message
+            if message['type'] == 'joined':
+                player = message['player']
+                pygame.display.set_caption('Backgammon game %d, playing %s'
+                                           % (message['game'],
+                                              ('red', 'white')[player]))
+            elif message['type'] == 'rolled':
+                applyRoll(board, message)
+            elif message['type'] == 'state':
+                applyState(board, message)
+            elif message['type'] == 'left':
+                print('Your opponent has left the game')
+            elif message['type'] == 'error':
+                # Requests are answered in order and nothing else is sent
+                # while the dice wait, so an error then refuses the roll
+                if dice.requested is not None:
+                    dice.refused()
+                print('Server: %s' % message['message'])
+            elif message['type'] == 'closed':
+                print('The server closed the connection')
+                running = False
+        elif event.type == pygame.MOUSEBUTTONDOWN and \
+             board.getCurrentPlayer() == player and not board.isGameWon():
+            # Clicks only count on the local player's turn
+            try:
+                board.checkClick(event.pos)
+            except RollPending:
+                pass
+        if dice.timedOut():
+            print('Server: the server did not roll')
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+import collections
+import io
+import os
+import struct
+from array import array
+
+import gameState
+from gameState import SIZE
+
+# Binary game records. An archive is a short header followed by games, each a
+# stream of one or two byte events:
+#
+#   START player             game from the starting position
+#   POSITION player board    game from the 28 signed bytes of a GameState
+#   roll                     one byte, (die1 - 1) * 6 + die2 - 1
+#   MOVE | start, end        a checker move, with start BAR from the bar and
+#                            end OFF for a bear-off
+#   TURN                     the turn passes to the other player
+#   END winner               winner is 0, 1 or NO_WINNER if unfinished
+#
+# Next to the archive an index file holds the little-endian uint64 offset of
+# every game, so game n is found with one seek whatever the archive's size.
+
+MAGIC = b'BGGR'
+VERSION = 1
+HEADER = struct.Struct('<4sB')
+OFFSET = struct.Struct('<Q')
+INDEX_SUFFIX = '.idx'
+
+# Event tags. Rolls use the values below 36 and MOVE is or-ed with the start.
+MOVE = 0x40
+TURN = 0x80
+START = 0xF0
+POSITION = 0xF1
+END = 0xFE
+NO_WINNER = 0xFF
+ROLL = 0
+
+# Decoded events are (ROLL, die1, die2), (MOVE, start, end) and (TURN,)
+GameRecord = collections.namedtuple('GameRecord', 'state events winner')
+
+_CHUNK = 1 << 16
+_START_BOARD = array('b', gameState.START + (0, 0, 0, 0))
+
+
+class GameEncoder:
+    """Builds the bytes of one game event by event."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def startGame(self, state=None):
+        """Starts the game from state, or from the starting position with red
+        on roll if state is None."""
+        self.data = bytearray()
+        if state is None:
+            state = gameState.GameState()
+        if state.board == _START_BOARD:
+            self.data += bytes((START, state.currentPlayer))
+        else:
+            self.data += bytes((POSITION, state.currentPlayer))
+            self.data += state.board.tobytes()
+
+    def roll(self, die1, die2):
+        """Adds a roll of the dice."""
+        self.data.append((die1 - 1) * 6 + die2 - 1)
+
+    def move(self, start, end):
+        """Adds a single checker move."""
+        self.data += bytes((MOVE | start, end))
+
+    def changeTurn(self):
+        """Adds the end of a turn."""
+        self.data.append(TURN)
+
+    def mark(self):
+        """Returns a mark of the events so far, to rewind to later."""
+        return len(self.data)
+
+    def rewind(self, mark):
+        """Forgets the events added since mark was taken, as when moves are
+        taken back."""
+        del self.data[mark:]
+
+    def endGame(self, winner=None):
+        """Ends the game and returns its bytes."""
+        if winner is None:
+            winner = NO_WINNER
+        self.data += bytes((END, winner))
+        return bytes(self.data)
+
+
+class GameRecordWriter(GameEncoder):
+    """Appends games to an archive and its index. Events are collected for the
+    game in progress and written when it ends, so a crash never leaves half a
+    game in the archive. An archive that has lost its index is indexed again
+    before anything is added to it."""
+
+    def __init__(self, path):
+        GameEncoder.__init__(self)
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) and \
+           not os.path.exists(path + INDEX_SUFFIX):
+            buildIndex(path)
+        self.archive = open(path, 'ab')
+        if self.archive.tell() == 0:
+            self.archive.write(HEADER.pack(MAGIC, VERSION))
+        self.index = open(path + INDEX_SUFFIX, 'ab')
+        self.inGame = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def startGame(self, state=None):
+        if self.inGame:
+            self.endGame()
+        GameEncoder.startGame(self, state)
+        self.inGame = True
+
+    def endGame(self, winner=None):
+        """Ends the game in progress, appends it to the archive and returns
+        its bytes."""
+        data = GameEncoder.endGame(self, winner)
+        self.appendGame(data)
+        self.inGame = False
+        return data
+
+    def appendGame(self, data):
+        """Appends the bytes of a whole game, as built by a GameEncoder."""
+        self.index.write(OFFSET.pack(self.archive.tell()))
+        self.archive.write(data)
+
+    def flush(self):
+        """Pushes everything written so far to the files."""
+        self.archive.flush()
+        self.index.flush()
+
+    def close(self):
+        """Ends any game in progress without a winner and closes the
+        files."""
+        if self.inGame:
+            self.endGame()
+        self.archive.close()
+        self.index.close()
+
+
+def _checkHeader(f, path):
+    """Reads the archive header from f, raising ValueError if it is not
+    one."""
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError('%s is not a game record archive' % path)
+    magic, version = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('%s is not a game record archive' % path)
+
+
+def _eventSize(tag):
+    """Returns the number of bytes of the event starting with tag, or 0 if
+    tag does not start an event."""
+    if tag < 36 or tag == TURN:
+        return 1
+    if tag & 0xC0 == MOVE or tag in (START, END):
+        return 2
+    if tag == POSITION:
+        return 2 + SIZE
+    return 0
+
+
+def _parseGames(f):
+    """Yields (offset, GameRecord) for each game read from the file object f,
+    reading it a chunk at a time. Raises ValueError if f holds anything but
+    whole games."""
+    offset = f.tell()
+    buffer = b''
+    pos = 0
+    state = None
+    events = None
+    start = offset
+    while True:
+        # Keeps at least one whole event, the longest being a POSITION, in
+        # the buffer
+        if len(buffer) - pos < SIZE + 2:
+            buffer = buffer[pos:] + f.read(_CHUNK)
+            offset += pos
+            pos = 0
+            if not buffer:
+                if events is not None:
+                    raise ValueError('the game at offset %d has no end'
+                                     % start)
+                return
+        tag = buffer[pos]
+        size = _eventSize(tag)
+        if not size:
+            raise ValueError('bad event %#x at offset %d' % (tag,
+                                                             offset + pos))
+        if pos + size > len(buffer):
+            raise ValueError('truncated event at offset %d' % (offset + pos))
+        if events is None and tag not in (START, POSITION):
+            raise ValueError('event %#x at offset %d is outside a game'
+                             % (tag, offset + pos))
+        if tag < 36:
+            events.append((ROLL, tag // 6 + 1, tag % 6 + 1))
+            pos += 1
+        elif tag & 0xC0 == MOVE:
+            events.append((MOVE, tag & 0x3F, buffer[pos + 1]))
+            pos += 2
+        elif tag == TURN:
+            events.append((TURN,))
+            pos += 1
+        elif tag == START:
+            start = offset + pos
+            state = gameState.GameState(currentPlayer=buffer[pos + 1])
+            events = []
+            pos += 2
+        elif tag == POSITION:
+            start = offset + pos
+            board = array('b')
+            board.frombytes(buffer[pos + 2:pos + 2 + SIZE])
+            state = gameState.GameState(board, buffer[pos + 1])
+            events = []
+            pos += 2 + SIZE
+        elif tag == END:
+            winner = buffer[pos + 1]
+            if winner == NO_WINNER:
+                winner = None
+            pos += 2
+            record = GameRecord(state, events, winner)
+            events = None
+            yield start, record
+
+
+def readGames(path, first=0):
+    """Yields the GameRecords in the archive at path one at a time, starting
+    with game number first. Only a chunk of the archive is held in memory at
+    once."""
+    with open(path, 'rb') as f:
+        _checkHeader(f, path)
+        if first:
+            f.seek(gameOffset(path, first))
+        for offset, record in _parseGames(f):
+            yield record
+
+
+def decodeGame(data):
+    """Returns the GameRecord of the bytes of one game, as returned by
+    GameEncoder.endGame."""
+    for offset, record in _parseGames(io.BytesIO(data)):
+        return record
+    raise ValueError('no game in %d bytes' % len(data))
+
+
+def buildIndex(path):
+    """Rewrites the index of the archive at path by scanning it, and returns
+    the number of games."""
+    games = 0
+    with open(path, 'rb') as f, open(path + INDEX_SUFFIX, 'wb') as index:
+        _checkHeader(f, path)
+        for offset, record in _parseGames(f):
+            index.write(OFFSET.pack(offset))
+            games += 1
+    return games
+
+
+def gameOffset(path, n):
+    """Returns the offset of game n in the archive at path, read from its
+    index."""
+    with open(path + INDEX_SUFFIX, 'rb') as index:
+        index.seek(n * OFFSET.size)
+        data = index.read(OFFSET.size)
+    if len(data) < OFFSET.size:
+        raise IndexError('game %d is not in %s' % (n, path))
+    return OFFSET.unpack(data)[0]
+
+
+class GameArchive:
+    """Random access to the games of an archive through its index."""
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path + INDEX_SUFFIX):
+            buildIndex(path)
+
+    def __len__(self):
+        return os.path.getsize(self.path + INDEX_SUFFIX) // OFFSET.size
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        return next(readGames(self.path, n))
+
+    def __iter__(self):
+        return readGames(self.path)
+
+    def games(self, first=0):
+        """Yields the games from number first onwards."""
+        return readGames(self.path, first)
+
+
+def replay(record):
+    """Yields the event and the GameState after it for every event of a
+    GameRecord. The same GameState is updated each time."""
+    state = record.state.copy()
+    for event in record.events:
+        if event[0] == MOVE:
+            state.moveChecker(event[1], event[2])
+        elif event[0] == TURN:
+            state.changeTurn()
+        yield event, state
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import itertools
+import json
+
+import diceSource
+import gameState
+import gnubgId
+import moveGeneration
+
+# Multiplayer server. Every game is a headless Game holding a GameState, so
+# one process can host thousands of them without a surface each, and every
+# roll and move is checked against the same legalFirstMoves rules the GUI's
+# Board uses.
+#
+# Clients talk to the server over TCP with one JSON object per line. A
+# WebSocket front end would carry the same objects, one per text frame, and
+# call GameServer.handleMessage in the same way handleConnection does.
+#
+# Client to server:
+#   {"type": "create"}                  start a game and wait for an opponent
+#   {"type": "join", "game": id}        join game id, or any waiting game if
+#                                       id is left out
+#   {"type": "roll"}                    roll the dice
+#   {"type": "move", "start": s, "end": e, "die": n}
+#                                       move one checker, with start 24 for
+#                                       the bar and end 26 to bear off. die is
+#                                       optional and picks the number used to
+#                                       bear off when more than one would do
+#   {"type": "state"}                   ask for the game's state
+#
+# Server to client:
+#   {"type": "joined", "game": id, "player": p}
+#   {"type": "rolled", "dice": [d1, d2]}     to the player who rolled
+#   {"type": "state", ...}                   see Game.describe, sent to both
+#                                            players after every change
+#   {"type": "left", "player": p}            the opponent disconnected
+#   {"type": "error", "message": text}       the request was refused
+#
+# A turn ends by itself once the dice are used up or no legal move is left,
+# so there is no request to pass.
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+class RuleError(Exception):
+    """Raised for a request the rules or the game's progress do not
+    allow."""
+    pass
+
+
+class Game:
+    """Headless game between two players, who are referred to by their
+    indices."""
+
+    def __init__(self, gameId, dice=None, state=None):
+        if dice is None:
+            dice = diceSource.SeededDice()
+        if state is None:
+            state = gameState.GameState()
+        self.gameId = gameId
+        self.dice = dice
+        self.state = state.copy()
+        self.lastRoll = None
+        self.numbers = []
+        self.rolled = False
+        self.winner = state.winner()
+
+        # Moves the player on roll may make next, worked out once after
+        # every change since each request checks them and every state
+        # message lists them
+        self.moves = []
+
+    def _checkTurn(self, player):
+        """Raises RuleError unless the game is on and it is player's
+        turn."""
+        if self.winner is not None:
+            raise RuleError('the game is over')
+        if player != self.state.currentPlayer:
+            raise RuleError('it is not your turn')
+
+    def legalMoves(self):
+        """Returns the (start, end, die) moves the player on roll may make
+        next."""
+        return self.moves
+
+    def _findMoves(self):
+        """Works out the legal moves again, passing the turn if there are
+        none left."""
+        self.moves = moveGeneration.legalFirstMoves(self.state, self.numbers)
+        if not self.moves:
+            self._endTurn()
+
+    def roll(self, player):
+        """Rolls the dice for player and returns them. The turn passes at
+        once if none of the numbers can be played."""
+        self._checkTurn(player)
+        if self.rolled:
+            raise RuleError('the dice have already been rolled')
+        self.lastRoll = self.dice.roll()
+        self.numbers = moveGeneration.diceNumbers(self.lastRoll)
+        self.rolled = True
+        self._findMoves()
+        return self.lastRoll
+
+    def move(self, player, start, end, die=None):
+        """Moves one of player's checkers from start to end, using die, or
+        the smallest number that allows the move when die is None."""
+        self._checkTurn(player)
+        if not self.rolled:
+            raise RuleError('roll the dice first')
+        numbers = [n for s, e, n in self.moves
+                   if s == start and e == end and die in (None, n)]
+        if not numbers:
+            raise RuleError('%s/%s is not a legal move' % (start, end))
+        self.state.moveChecker(start, end)
+        self.numbers.remove(min(numbers))
+        if self.state.isWon(player):
+            self.winner = player
+            self.numbers = []
+            self.moves = []
+            self.rolled = False
+        else:
+            self._findMoves()
+
+    def _endTurn(self):
+        """Passes the turn to the other player."""
+        self.numbers = []
+        self.moves = []
+        self.rolled = False
+        self.state.changeTurn()
+
+    def describe(self):
+        """Returns the game as a state message."""
+        return {'type': 'state', 'game': self.gameId,
+                'board': list(self.state.board),
+                'player': self.state.currentPlayer,
+                'dice': self.lastRoll and list(self.lastRoll),
+                'rolled': self.rolled, 'numbers': self.numbers,
+                'moves': self.moves,
+                'winner': self.winner,
+                'positionId': gnubgId.positionId(self.state)}
+
+
+def encode(message):
+    """Returns message as a line of JSON."""
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class Connection:
+    """One client's connection, with the game and seat it has taken."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.game = None
+        self.player = None
+
+    def send(self, message):
+        """Queues message to be written to the client."""
+        self.writer.write(encode(message))
+
+
+class GameServer:
+    """Hosts games for the clients connected to it. Every game's dice come
+    from its own SeededDice, seeded from seed and the game's number when a
+    seed is given."""
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.games = {}
+        self.seats = {}
+        self.waiting = []
+        self.gameIds = itertools.count()
+
+    def createGame(self):
+        """Returns a new game, with no one seated yet."""
+        gameId = next(self.gameIds)
+        seed = None if self.seed is None else self.seed + gameId
+        game = Game(gameId, diceSource.SeededDice(seed))
+        self.games[gameId] = game
+        self.seats[gameId] = [None, None]
+        return game
+
+    def seat(self, connection, game, player):
+        """Seats connection in game as player."""
+        if connection.game is not None:
+            raise RuleError('you are already in a game')
+        connection.game = game
+        connection.player = player
+        self.seats[game.gameId][player] = connection
+        connection.send({'type': 'joined', 'game': game.gameId,
+                         'player': player})
+
+    def broadcast(self, game, message):
+        """Sends message to everyone seated in game, encoding it only
+        once."""
+        data = encode(message)
+        for connection in self.seats[game.gameId]:
+            if connection is not None:
+                connection.writer.write(data)
+
+    def handleMessage(self, connection, message):
+        """Carries out one request from connection. Refused requests are
+        answered with an error and the game's state."""
+        try:
+            kind = message.get('type')
+            if kind == 'create':
+                game = self.createGame()
+                self.seat(connection, game, gameState.RED)
+                self.waiting.append(game)
+            elif kind == 'join':
+                self.join(connection, message.get('game'))
+            else:
+                game = connection.game
+                if game is None:
+                    raise RuleError('create or join a game first')
+                if game in self.waiting and kind != 'state':
+                    raise RuleError('the game is waiting for an opponent')
+                if kind == 'roll':
+                    dice = game.roll(connection.player)
+                    connection.send({'type': 'rolled', 'dice': list(dice)})
+                    self.broadcast(game, game.describe())
+                elif kind == 'move':
+                    game.move(connection.player, int(message['start']),
+                              int(message['end']), message.get('die'))
+                    self.broadcast(game, game.describe())
+                elif kind == 'state':
+                    connection.send(game.describe())
+                else:
+                    raise RuleError('unknown request %r' % kind)
+        except KeyError as error:
+            self.refuse(connection, 'the request has no %s' % error)
+        except (RuleError, TypeError, ValueError) as error:
+            self.refuse(connection, str(error))
+
+    def refuse(self, connection, reason):
+        """Answers a refused request with an error and the game's
+        state."""
+        connection.send({'type': 'error', 'message': reason})
+        if connection.game is not None:
+            connection.send(connection.game.describe())
+
+    def join(self, connection, gameId):
+        """Seats connection as white in game gameId, or in the oldest game
+        waiting for an opponent if gameId is None."""
+        if gameId is None:
+            if not self.waiting:
+                raise RuleError('no game is waiting for a player')
+            game = self.waiting[0]
+        else:
+            game = self.games.get(gameId)
+            if game is None or game not in self.waiting:
+                raise RuleError('game %r is not waiting for a player'
+                                % gameId)
+        self.seat(connection, game, gameState.WHITE)
+        self.waiting.remove(game)
+        self.broadcast(game, game.describe())
+
+    def leave(self, connection):
+        """Removes a disconnected client from its game, telling the
+        opponent. A game is dropped once both players have gone."""
+        game = connection.game
+        if game is None:
+            return
+        seats = self.seats[game.gameId]
+        seats[connection.player] = None
+        if game in self.waiting:
+            self.waiting.remove(game)
+        if seats == [None, None]:
+            del self.games[game.gameId]
+            del self.seats[game.gameId]
+        else:
+            self.broadcast(game, {'type': 'left',
+                                  'player': connection.player})
+
+    async def handleConnection(self, reader, writer):
+        """Serves one client until it disconnects."""
+        connection = Connection(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    connection.send({'type': 'error',
+                                     'message': 'not a JSON message'})
+                else:
+                    if isinstance(message, dict):
+                        self.handleMessage(connection, message)
+                    else:
+                        connection.send({'type': 'error',
+                                         'message': 'not a JSON object'})
+                await self.flush(connection.game, writer)
+        except ConnectionError:
+            pass
+        finally:
+            self.leave(connection)
+            writer.close()
+
+    async def flush(self, game, writer):
+        """Waits for the messages to the players of game, or to writer if
+        it has no game, to be handed to the network."""
+        writers = [writer]
+        if game is not None and game.gameId in self.seats:
+            writers = [seat.writer for seat in self.seats[game.gameId]
+                       if seat is not None]
+        for w in writers:
+            try:
+                await w.drain()
+            except ConnectionError:
+                pass
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Starts listening and returns the asyncio server. Port 0 picks a
+        free port, which the server's sockets report."""
+        return await asyncio.start_server(self.handleConnection, host, port)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, seed=None):
+    """Runs a GameServer until it is cancelled."""
+    server = await GameServer(seed).start(host, port)
+    for socket in server.sockets:
+        print('Serving backgammon on %s:%d' % socket.getsockname()[:2])
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    """Runs the server from the command line."""
+    parser = argparse.ArgumentParser(description='Host backgammon games '
+                                     'over TCP.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed the dice of game N with seed + N')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
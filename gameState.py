@@ -0,0 +1,339 @@
+import random
+from array import array
+
+# Player indices. These match the order of Board.players and Board.bar.
+RED = 0
+WHITE = 1
+
+CHECKERS = 15 #checkers each player starts with
+NUM_POINTS = 24
+
+# Layout of the position array. Slots 0-23 are the points, holding a signed
+# count (positive for red checkers, negative for white ones). Slots 24 and 25
+# hold the red and white bar counts and slots 26 and 27 the red and white
+# borne-off counts, so a player's bar is BAR + player and their borne-off
+# checkers are OFF + player. The same values are used as the start of a move
+# entering from the bar and the end of a move bearing a checker off.
+BAR = 24
+OFF = 26
+SIZE = 28
+
+# Starting position for points 0-23, mirroring the setup in main.Board
+START = (2, 0, 0, 0, 0, -5, 0, -3, 0, 0, 0, 5,
+         -5, 0, 0, 0, 3, 0, 5, 0, 0, 0, 0, -2)
+
+# Zobrist keys. Slot s holding count c contributes ZOBRIST[s * 31 + c + 15]
+# to the hash, with the key for an empty slot being 0, and ZOBRIST_WHITE is
+# added when white is on roll. The keys come from a fixed seed so hashes are
+# the same in every process.
+_zobristRandom = random.Random(0x6261636b)
+ZOBRIST = [0 if count == 0 else _zobristRandom.getrandbits(64)
+           for slot in range(SIZE) for count in range(-CHECKERS, CHECKERS + 1)]
+ZOBRIST_WHITE = _zobristRandom.getrandbits(64)
+del _zobristRandom
+
+# Running totals. Every player's pip count, number of checkers outside their
+# home board, occupied points and blots are packed into the fields of one
+# integer, the tally. Like the Zobrist keys, slot s holding count c adds
+# TALLY[s * 31 + c + 15] to it, so a change to a slot updates all the totals
+# with one addition. Each field only ever holds a non-negative value that fits
+# its width, so the fields never carry into each other. Point masks have bit
+# i set for point i.
+POINT_MASK = (1 << NUM_POINTS) - 1
+HOME_MASK = (POINT_MASK ^ ((1 << 18) - 1), (1 << 6) - 1) #points in each home
+_PIP_SHIFT = (0, 10)
+_OUTSIDE_SHIFT = (20, 25)
+_OCCUPIED_SHIFT = (30, 30 + NUM_POINTS)
+_BLOT_SHIFT = (30 + 2 * NUM_POINTS, 30 + 3 * NUM_POINTS)
+
+
+def _slotTally(slot, count):
+    """Returns what slot holding count adds to the tally."""
+    if slot >= OFF:
+        return 0
+    if slot >= BAR:
+        player = slot - BAR
+        return (count * 25 << _PIP_SHIFT[player]) + \
+            (count << _OUTSIDE_SHIFT[player])
+    player = RED if count > 0 else WHITE
+    count = abs(count)
+    if not count:
+        return 0
+    tally = 0
+    if player == RED:
+        tally += count * (NUM_POINTS - slot) << _PIP_SHIFT[RED]
+    else:
+        tally += count * (slot + 1) << _PIP_SHIFT[WHITE]
+    if not HOME_MASK[player] >> slot & 1:
+        tally += count << _OUTSIDE_SHIFT[player]
+    tally += 1 << slot + _OCCUPIED_SHIFT[player]
+    if count == 1:
+        tally += 1 << slot + _BLOT_SHIFT[player]
+    return tally
+
+
+TALLY = [_slotTally(slot, count)
+         for slot in range(SIZE) for count in range(-CHECKERS, CHECKERS + 1)]
+
+
+def bitCount(mask):
+    """Returns the number of points in a point mask."""
+    return bin(mask).count('1')
+
+
+class GameState:
+    """Compact, pygame-free backgammon position. Holds the point, bar and
+    borne-off counts for both players in one fixed-size array along with the
+    index of the player whose turn it is. zobrist is a 64-bit hash of the
+    position and tally holds its running totals, both kept up to date as
+    checkers move."""
+
+    __slots__ = ('board', 'currentPlayer', 'zobrist', 'tally')
+
+    def __init__(self, board=None, currentPlayer=RED):
+        if board is None:
+            board = START + (0, 0, 0, 0)
+        self.board = array('b', board)
+        self.currentPlayer = currentPlayer
+        self.zobrist = self.computeZobrist()
+        self.tally = self.computeTally()
+
+    def copy(self):
+        """Returns an independent copy of the position."""
+        state = GameState.__new__(GameState)
+        state.board = array('b', self.board)
+        state.currentPlayer = self.currentPlayer
+        state.zobrist = self.zobrist
+        state.tally = self.tally
+        return state
+
+    def _derive(self, changes):
+        """Returns a copy of the position with each slot in changes, a list
+        of (slot, count) pairs, set to count. Only those slots are XORed into
+        the hash and added to the tally, so move generation, which knows the
+        slots a play changes, never recomputes them from scratch."""
+        state = GameState.__new__(GameState)
+        board = state.board = array('b', self.board)
+        zobrist = self.zobrist
+        tally = self.tally
+        for slot, count in changes:
+            old = slot * 31 + CHECKERS + board[slot]
+            new = slot * 31 + CHECKERS + count
+            board[slot] = count
+            zobrist ^= ZOBRIST[old] ^ ZOBRIST[new]
+            tally += TALLY[new] - TALLY[old]
+        state.currentPlayer = self.currentPlayer
+        state.zobrist = zobrist
+        state.tally = tally
+        return state
+
+    def computeZobrist(self):
+        """Returns the Zobrist hash of the position, computed from scratch."""
+        zobrist = ZOBRIST_WHITE if self.currentPlayer == WHITE else 0
+        for slot in range(SIZE):
+            zobrist ^= ZOBRIST[slot * 31 + self.board[slot] + CHECKERS]
+        return zobrist
+
+    def computeTally(self):
+        """Returns the tally of the position, computed from scratch."""
+        board = self.board
+        return sum([TALLY[slot * 31 + board[slot] + CHECKERS]
+                    for slot in range(SIZE)])
+
+    def _add(self, slot, amount):
+        """Adds amount to the count in slot and updates the hash and the
+        tally."""
+        old = slot * 31 + CHECKERS + self.board[slot]
+        new = old + amount
+        self.board[slot] += amount
+        self.zobrist ^= ZOBRIST[old] ^ ZOBRIST[new]
+        self.tally += TALLY[new] - TALLY[old]
+
+    def key(self):
+        """Returns a hashable snapshot of the position and the player on
+        roll."""
+        return self.board.tobytes() + bytes((self.currentPlayer,))
+
+    def __eq__(self, other):
+        return isinstance(other, GameState) and \
+            self.currentPlayer == other.currentPlayer and \
+            self.board == other.board
+
+    def __hash__(self):
+        return self.zobrist
+
+    def __repr__(self):
+        return 'GameState(%r, %d)' % (tuple(self.board), self.currentPlayer)
+
+    def direction(self, player=None):
+        """Returns +1 if player moves up the point numbers, -1 otherwise."""
+        if player is None:
+            player = self.currentPlayer
+        return (-1) ** player
+
+    def count(self, point):
+        """Returns the number of checkers on point regardless of color."""
+        return abs(self.board[point])
+
+    def owner(self, point):
+        """Returns the index of the player occupying point, or None if the
+        point is open."""
+        count = self.board[point]
+        if count > 0:
+            return RED
+        if count < 0:
+            return WHITE
+        return None
+
+    def isOpen(self, point):
+        """Returns True if point holds no checkers."""
+        return not self.board[point]
+
+    def isBlot(self, point):
+        """Returns True if point holds exactly one checker."""
+        return self.board[point] in (1, -1)
+
+    def barCount(self, player):
+        """Returns the number of player's checkers on the bar."""
+        return self.board[BAR + player]
+
+    def offCount(self, player):
+        """Returns the number of player's checkers that were borne off."""
+        return self.board[OFF + player]
+
+    def canLand(self, point, player=None):
+        """Returns True if player may move a checker onto point, which is the
+        case unless the opponent holds two or more checkers there."""
+        if player is None:
+            player = self.currentPlayer
+        count = self.board[point]
+        if player == RED:
+            return count >= -1
+        return count <= 1
+
+    def entryPoint(self, die, player=None):
+        """Returns the point a checker from the bar enters on with die."""
+        if player is None:
+            player = self.currentPlayer
+        if player == RED:
+            return die - 1
+        return NUM_POINTS - die
+
+    def distance(self, start, end, player=None):
+        """Returns the number of pips covered by the move from start to end.
+        For bear-offs this is the distance to the edge of the board."""
+        if player is None:
+            player = self.currentPlayer
+        if start == BAR:
+            start = -1 if player == RED else NUM_POINTS
+        if end == OFF:
+            end = NUM_POINTS if player == RED else -1
+        return (end - start) * (-1) ** player
+
+    def pointHit(self, point):
+        """Sends the blot on point to its owner's bar."""
+        count = self.board[point]
+        self._add(point, -count)
+        if count > 0:
+            self._add(BAR + RED, 1)
+        else:
+            self._add(BAR + WHITE, 1)
+
+    def moveChecker(self, start, end):
+        """Moves one of the current player's checkers from start to end,
+        hitting a blot if there is one. start may be BAR and end may be OFF.
+        Returns True if an opposing checker was hit. The move is assumed to be
+        legal."""
+        player = self.currentPlayer
+        step = 1 if player == RED else -1
+
+        if start == BAR:
+            self._add(BAR + player, -1)
+        else:
+            self._add(start, -step)
+
+        if end == OFF:
+            self._add(OFF + player, 1)
+            return False
+
+        hit = self.board[end] == -step
+        if hit:
+            self.pointHit(end)
+        self._add(end, step)
+        return hit
+
+    def moveCheckerFromBar(self, end):
+        """Enters one of the current player's checkers from the bar onto
+        end. Returns True if an opposing checker was hit."""
+        return self.moveChecker(BAR, end)
+
+    def bearOff(self, start):
+        """Removes one of the current player's checkers on start from the
+        board."""
+        self.moveChecker(start, OFF)
+
+    def applyPlay(self, play):
+        """Applies a sequence of (start, end) moves for the current player."""
+        for start, end in play:
+            self.moveChecker(start, end)
+
+    def changeTurn(self):
+        """Passes the turn to the other player."""
+        self.currentPlayer = 1 - self.currentPlayer
+        self.zobrist ^= ZOBRIST_WHITE
+
+    def outsideCount(self, player=None):
+        """Returns the number of player's checkers on the bar or outside
+        their home board."""
+        if player is None:
+            player = self.currentPlayer
+        return self.tally >> _OUTSIDE_SHIFT[player] & 31
+
+    def isHome(self, player=None):
+        """Returns True if all of player's checkers still in play are in
+        their home board, so they may start bearing off."""
+        if player is None:
+            player = self.currentPlayer
+        return not self.tally >> _OUTSIDE_SHIFT[player] & 31
+
+    def occupiedMask(self, player=None):
+        """Returns the mask of the points holding player's checkers."""
+        if player is None:
+            player = self.currentPlayer
+        return self.tally >> _OCCUPIED_SHIFT[player] & POINT_MASK
+
+    def blotMask(self, player=None):
+        """Returns the mask of the points holding exactly one of player's
+        checkers."""
+        if player is None:
+            player = self.currentPlayer
+        return self.tally >> _BLOT_SHIFT[player] & POINT_MASK
+
+    def madeMask(self, player=None):
+        """Returns the mask of the points holding two or more of player's
+        checkers."""
+        if player is None:
+            player = self.currentPlayer
+        tally = self.tally
+        return (tally >> _OCCUPIED_SHIFT[player] & ~(
+            tally >> _BLOT_SHIFT[player])) & POINT_MASK
+
+    def isWon(self, player=None):
+        """Returns True if player has borne off all their checkers."""
+        if player is None:
+            player = self.currentPlayer
+        return self.board[OFF + player] == CHECKERS
+
+    def winner(self):
+        """Returns the index of the player who has won, or None if the game
+        is still going on."""
+        for player in (RED, WHITE):
+            if self.board[OFF + player] == CHECKERS:
+                return player
+        return None
+
+    def pipCount(self, player=None):
+        """Returns the total number of pips player needs to bear off."""
+        if player is None:
+            player = self.currentPlayer
+        return self.tally >> _PIP_SHIFT[player] & 1023
@@ -0,0 +1,217 @@
+import base64
+import binascii
+import collections
+
+import gameState
+from gameState import BAR, OFF, RED, WHITE, CHECKERS, SIZE
+
+# GNU Backgammon Position IDs and Match IDs.
+#
+# A Position ID packs both sides of the board into 80 bits, player not on roll
+# first. Each side lists its checkers on its own points 1 to 24 and then its
+# bar, writing a 1 bit for every checker and a 0 bit to end the point. The
+# bits fill bytes from the lowest bit up and the 10 bytes are base64 encoded
+# without the padding, giving 14 characters. The starting position is
+# 4HPwATDgc/ABMA.
+#
+# A Match ID packs the cube, dice and score into 66 bits the same way, giving
+# 12 characters.
+
+# Game states in a Match ID
+NO_GAME = 0
+PLAYING = 1
+OVER = 2
+RESIGNED = 3
+DROPPED = 4
+
+# Cube owner value in a Match ID for a centred cube
+_CENTERED = 3
+
+# Score and cube state of a match. cubeOwner is None for a centred cube, dice
+# is None before the roll and matchLength is 0 for money play. onRoll holds
+# the dice and turn is the player to make a decision, which differs from
+# onRoll while a double is offered.
+MatchState = collections.namedtuple(
+    'MatchState', 'cubeValue cubeOwner onRoll crawford gameState turn '
+    'doubleOffered resigned dice matchLength score')
+MatchState.__new__.__defaults__ = (1, None, RED, False, PLAYING, RED, False,
+                                   0, None, 0, (0, 0))
+
+# Each side's points from its own 1 point to its 24 point
+_POINTS = (tuple(range(23, -1, -1)), tuple(range(24)))
+_SIGNS = (1, -1)
+
+# _ONES[n] is n set bits
+_ONES = [(1 << n) - 1 for n in range(CHECKERS + 1)]
+
+# Widths in bits of the Match ID fields, lowest first
+_MATCH_FIELDS = (4, 2, 1, 1, 3, 1, 1, 2, 3, 3, 15, 15, 15)
+
+
+def positionKey(state):
+    """Returns the 80-bit Position ID key of state as an integer. Equal
+    positions with the same player on roll have equal keys."""
+    board = state.board
+    player = state.currentPlayer
+    key = 0
+    shift = 0
+    for side in (1 - player, player):
+        sign = _SIGNS[side]
+        for point in _POINTS[side]:
+            count = board[point] * sign
+            if count > 0:
+                key |= _ONES[count] << shift
+                shift += count
+            shift += 1
+        count = board[BAR + side]
+        key |= _ONES[count] << shift
+        shift += count + 1
+    return key
+
+
+def positionId(state):
+    """Returns the 14 character Position ID of state."""
+    data = positionKey(state).to_bytes(10, 'little')
+    return base64.b64encode(data)[:14].decode('ascii')
+
+
+def _decode(text, length, size):
+    """Returns the little-endian integer in the base64 string text of length
+    characters holding size bytes, raising ValueError if it is malformed."""
+    if len(text) != length:
+        raise ValueError('%r is not %d characters long' % (text, length))
+    padding = '=' * (-length % 4)
+    try:
+        data = base64.b64decode(text + padding, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError('%r is not valid base64' % text)
+    return int.from_bytes(data[:size], 'little')
+
+
+def stateFromKey(key, player=RED):
+    """Returns the GameState with the Position ID key and player on roll,
+    raising ValueError if the key is not a legal position."""
+    board = [0] * SIZE
+    for side in (1 - player, player):
+        sign = _SIGNS[side]
+        total = 0
+        for slot in range(25):
+            # The run of set bits at the bottom of key is the point's count
+            count = (~key & (key + 1)).bit_length() - 1
+            key >>= count + 1
+            total += count
+            if slot == 24:
+                board[BAR + side] = count
+            elif count:
+                point = _POINTS[side][slot]
+                if board[point]:
+                    raise ValueError('both players have checkers on point '
+                                     '%d' % point)
+                board[point] = sign * count
+        if total > CHECKERS:
+            raise ValueError('a player has more than %d checkers' % CHECKERS)
+        board[OFF + side] = CHECKERS - total
+    if key:
+        raise ValueError('the key has bits beyond both sides')
+    if board[OFF] == board[OFF + 1] == CHECKERS:
+        raise ValueError('neither player has any checkers left')
+    return gameState.GameState(board, player)
+
+
+def decodePositionId(text, player=RED):
+    """Returns the GameState for a Position ID with player on roll."""
+    return stateFromKey(_decode(text, 14, 10), player)
+
+
+def matchId(match=None):
+    """Returns the 12 character Match ID of a MatchState, by default a money
+    game with red on roll before rolling."""
+    if match is None:
+        match = MatchState()
+    cubeOwner = _CENTERED if match.cubeOwner is None else match.cubeOwner
+    die1, die2 = match.dice or (0, 0)
+    values = (match.cubeValue.bit_length() - 1, cubeOwner, match.onRoll,
+              int(match.crawford), match.gameState, match.turn,
+              int(match.doubleOffered), match.resigned, die1, die2,
+              match.matchLength, match.score[0], match.score[1])
+    key = 0
+    shift = 0
+    for value, width in zip(values, _MATCH_FIELDS):
+        key |= value << shift
+        shift += width
+    return base64.b64encode(key.to_bytes(9, 'little')).decode('ascii')
+
+
+def decodeMatchId(text):
+    """Returns the MatchState of a Match ID."""
+    key = _decode(text, 12, 9)
+    values = []
+    for width in _MATCH_FIELDS:
+        values.append(key & _ONES[width])
+        key >>= width
+    (cubeLog, cubeOwner, onRoll, crawford, state, turn, doubleOffered,
+     resigned, die1, die2, matchLength, score0, score1) = values
+    if die1 > 6 or die2 > 6 or bool(die1) != bool(die2):
+        raise ValueError('%r has impossible dice' % text)
+    return MatchState(1 << cubeLog,
+                      None if cubeOwner == _CENTERED else cubeOwner,
+                      onRoll, bool(crawford), state, turn,
+                      bool(doubleOffered), resigned,
+                      (die1, die2) if die1 else None, matchLength,
+                      (score0, score1))
+
+
+def encode(state, match=None):
+    """Returns the combined 'PositionID:MatchID' string gnubg shows for
+    state. The Match ID is a money game with the player on roll in state
+    unless match is given."""
+    if match is None:
+        match = MatchState(onRoll=state.currentPlayer,
+                           turn=state.currentPlayer)
+    return positionId(state) + ':' + matchId(match)
+
+
+def decode(text):
+    """Returns (GameState, MatchState) for a Position ID, optionally followed
+    by ':' and a Match ID that says who is on roll."""
+    positionText, separator, matchText = text.strip().partition(':')
+    if not matchText:
+        return decodePositionId(positionText), None
+    match = decodeMatchId(matchText)
+    return decodePositionId(positionText, match.onRoll), match
+
+
+def positionKeys(states):
+    """Returns the Position ID keys of a list of GameStates as an N x 10
+    uint8 array, packed for the whole list at once with NumPy."""
+    # numpy is only needed here, so the GUI does not import it for IDs
+    import numpy
+    count = len(states)
+    boards = numpy.frombuffer(b''.join([state.board.tobytes()
+                                        for state in states]),
+                              dtype=numpy.int8).reshape(count, SIZE)
+    boards = boards.astype(numpy.int16)
+    red = numpy.empty((count, 25), dtype=numpy.int16)
+    red[:, :24] = numpy.maximum(boards[:, 23::-1], 0)
+    red[:, 24] = boards[:, BAR + RED]
+    white = numpy.empty((count, 25), dtype=numpy.int16)
+    white[:, :24] = numpy.maximum(-boards[:, :24], 0)
+    white[:, 24] = boards[:, BAR + WHITE]
+    redOnRoll = numpy.array([state.currentPlayer == RED
+                             for state in states])[:, None]
+    counts = numpy.where(redOnRoll, numpy.hstack((white, red)),
+                         numpy.hstack((red, white)))
+
+    # Every bit up to the zero ending the last count is set except the zeros
+    # ending each count
+    zeros = numpy.cumsum(counts + 1, axis=1, dtype=numpy.intp) - 1
+    bits = numpy.arange(80) <= zeros[:, -1:]
+    zeros += numpy.arange(0, 80 * count, 80)[:, None]
+    bits.ravel()[zeros.ravel()] = False
+    return numpy.packbits(bits, axis=1, bitorder='little')
+
+
+def positionIds(states):
+    """Returns the Position IDs of a list of GameStates."""
+    return [base64.b64encode(key.tobytes())[:14].decode('ascii')
+            for key in positionKeys(states)]
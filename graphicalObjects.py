@@ -1,6 +1,6 @@
+import collections
+import math
 import pygame
-import numpy
-pygame.font.init()
 
 
 # Rgb color constants
@@ -12,6 +12,42 @@ BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 YELLOW = (0, 255, 255)
 
+FONT_FAMILY = 'Monospace'
+MAX_RENDERED = 256 #most rendered strings kept by renderText
+
+# Loaded fonts keyed by (family, size), and rendered strings keyed by
+# (string, size, color, family) with the least recently used dropped first
+_fonts = {}
+_rendered = collections.OrderedDict()
+
+
+def getFont(size, family=FONT_FAMILY):
+    """Returns the system font family at size, loading it only once."""
+    font = _fonts.get((family, size))
+    if font is None:
+        # The font module is started on first use, so importing this module
+        # stays cheap for code that never draws text
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.SysFont(family, size)
+        _fonts[(family, size)] = font
+    return font
+
+
+def renderText(string, size, color, family=FONT_FAMILY):
+    """Returns a surface with string rendered in color, reusing the surface
+    from an earlier call with the same arguments when it is still cached."""
+    key = (string, size, color, family)
+    label = _rendered.get(key)
+    if label is None:
+        label = getFont(size, family).render(string, 1, color)
+        _rendered[key] = label
+        if len(_rendered) > MAX_RENDERED:
+            _rendered.popitem(last=False)
+    else:
+        _rendered.move_to_end(key)
+    return label
+
 
 class Text:
     """Class for displaying and manipulating text."""
@@ -29,18 +65,70 @@ class Text:
 
     def draw(self, surface):
         """Draws the text to the surface."""
-        self.myfont = pygame.font.SysFont('Monospace', self.size)
-        self.label = self.myfont.render(self.string, 1, self.color)
-        surface.blit(self.label, self.position)
+        surface.blit(renderText(self.string, self.size, self.color),
+                     self.position)
+
+    def getRect(self):
+        """Returns the rectangle the text covers when drawn."""
+        width, height = getFont(self.size).size(self.string)
+        return pygame.Rect(self.position[0], self.position[1], width, height)
 
     def resetText(self, string, surface, color = BLACK):
-        """Resets the text to display a new string."""
-        temp = self.color
-        self.color = BLACK
-        self.draw(surface)
-        self.color = temp
+        """Resets the text to display a new string, clearing the old one with
+        color."""
+        surface.fill(color, self.getRect())
         self.string = string
-        self.draw(surface)  
+        self.draw(surface)
+
+
+class HitGrid:
+    """Lookup table from each pixel of a fixed layout to the widget drawn
+    there, so a click finds its widget in constant time. Shapes register
+    the same areas their checkClick methods test."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cells = bytearray(width * height) #widget index + 1, or 0
+        self.widgets = []
+
+    def addWidget(self, widget):
+        """Adds widget to the grid and returns the id its areas use."""
+        self.widgets.append(widget)
+        return len(self.widgets)
+
+    def addSpan(self, y, left, right, widgetId):
+        """Marks the pixels from left to right inclusive on row y."""
+        left = max(left, 0)
+        right = min(right, self.width - 1)
+        if 0 <= y < self.height and left <= right:
+            start = y * self.width
+            self.cells[start + left:start + right + 1] = \
+                bytes([widgetId]) * (right - left + 1)
+
+    def addBox(self, left, top, right, bottom, widgetId):
+        """Marks the pixels strictly inside the box from (left, top) to
+        (right, bottom)."""
+        for y in range(math.floor(top) + 1, math.ceil(bottom)):
+            self.addSpan(y, math.floor(left) + 1, math.ceil(right) - 1,
+                         widgetId)
+
+    def addDisc(self, center, radius, widgetId):
+        """Marks the pixels closer than radius to center."""
+        for dy in range(-radius + 1, radius):
+            # Largest dx with dx * dx + dy * dy < radius * radius
+            dx = math.isqrt(radius * radius - dy * dy - 1)
+            self.addSpan(center[1] + dy, center[0] - dx, center[0] + dx,
+                         widgetId)
+
+    def lookup(self, pos):
+        """Returns the widget at pos, or None if there is none."""
+        x, y = pos
+        if 0 <= x < self.width and 0 <= y < self.height:
+            widgetId = self.cells[y * self.width + x]
+            if widgetId:
+                return self.widgets[widgetId - 1]
+        return None
 
 
 class Rectangle:
@@ -55,7 +143,17 @@ class Rectangle:
     def draw(self, surface):
         """Draws the rectangle to the surface."""
         pygame.draw.rect(surface, self.color,(self.uL[0], self.uL[1], self.width, self.height))
-        pygame.draw.rect(surface, BLACK,(self.uL[0], self.uL[1], self.width, self.height), 1)
+        # The outline is drawn as lines because a clipped pygame.draw.rect
+        # outlines the clipped area instead of the rectangle
+        rect = self.getRect()
+        pygame.draw.lines(surface, BLACK, True,
+                          [rect.topleft, (rect.right - 1, rect.top),
+                           (rect.right - 1, rect.bottom - 1),
+                           (rect.left, rect.bottom - 1)])
+
+    def getRect(self):
+        """Returns the rectangle's bounding box."""
+        return pygame.Rect(self.uL[0], self.uL[1], self.width, self.height)
 
     def checkClick(self, position):
         """Given the mouse position, checks whether a player has clicked
@@ -65,6 +163,11 @@ class Rectangle:
             return True
         return False
 
+    def addHitArea(self, grid, widgetId):
+        """Marks the area checkClick accepts in the HitGrid grid."""
+        grid.addBox(self.uL[0], self.uL[1], self.uL[0] + self.width,
+                    self.uL[1] + self.height, widgetId)
+
 
 class Triangle:
     """Class for displaying and manipulating a triangle."""
@@ -83,6 +186,10 @@ class Triangle:
         self.borderColor = color
         self.borderWidth = width
 
+    def getBorder(self):
+        """Returns the border color and width."""
+        return (self.borderColor, self.borderWidth)
+
     def draw(self, surface):
         """Draws the triangle to surface."""
         pygame.draw.polygon(surface, self.color,
@@ -91,6 +198,26 @@ class Triangle:
                             (self.point1, self.point2, self.point3),
                             self.borderWidth)
 
+    def getRect(self):
+        """Returns the bounding box of the triangle, with room for its
+        widest border."""
+        xs = (self.point1[0], self.point2[0], self.point3[0])
+        ys = (self.point1[1], self.point2[1], self.point3[1])
+        rect = pygame.Rect(min(xs), min(ys), max(xs) - min(xs) + 1,
+                           max(ys) - min(ys) + 1)
+        return rect.inflate(4, 4)
+
+    def renderImage(self, borderColor, borderWidth):
+        """Returns a transparent image of the triangle with the given border
+        and the screen rectangle to blit it to."""
+        rect = self.getRect()
+        image = pygame.Surface(rect.size, pygame.SRCALPHA)
+        points = [(x - rect.left, y - rect.top)
+                  for x, y in (self.point1, self.point2, self.point3)]
+        pygame.draw.polygon(image, self.color, points)
+        pygame.draw.polygon(image, borderColor, points, borderWidth)
+        return image, rect
+
     def checkClick(self, position):
         """Given the mouse position, checks whether a player has clicked
            on the triangle."""
@@ -104,6 +231,15 @@ class Triangle:
                 return True
         return False
 
+    def addHitArea(self, grid, widgetId):
+        """Marks the area checkClick accepts in the HitGrid grid."""
+        if self.side == 'bottom':
+            grid.addBox(self.point2[0], self.point3[1], self.point1[0],
+                        self.point1[1], widgetId)
+        else:
+            grid.addBox(self.point1[0], self.point1[1], self.point2[0],
+                        self.point3[1], widgetId)
+
 
 class Circle:
     """Class for displaying and manipulating a circle."""
@@ -119,6 +255,12 @@ class Circle:
         pygame.draw.circle(surface, self.color, self.center, self.radius)
         pygame.draw.circle(surface, BLACK, self.center, self.radius, 1)
 
+    def getRect(self):
+        """Returns the circle's bounding box."""
+        return pygame.Rect(self.center[0] - self.radius,
+                           self.center[1] - self.radius,
+                           2 * self.radius + 1, 2 * self.radius + 1)
+
     def moveTo(self, center):
         """Moves the circle to be centered at center."""
         self.center = center
@@ -130,6 +272,10 @@ class Circle:
     def checkClick(self, pos):
         """Given the mouse position, checks whether a player has clicked
            on the circle."""
-        if numpy.linalg.norm(numpy.array(pos) - numpy.array(self.center)) < self.radius:
-            return True
-        return False
+        dx = pos[0] - self.center[0]
+        dy = pos[1] - self.center[1]
+        return dx * dx + dy * dy < self.radius * self.radius
+
+    def addHitArea(self, grid, widgetId):
+        """Marks the area checkClick accepts in the HitGrid grid."""
+        grid.addDisc(self.center, self.radius, widgetId)
@@ -0,0 +1,125 @@
+import collections
+import itertools
+import threading
+
+import pygame
+
+import search
+from evaluation import LOSS, WIN
+
+# Ranks the legal plays of the player on roll away from the pygame event
+# loop, so the window keeps responding however long the search takes. Each
+# request runs on a thread of its own. The ranking is delivered after every
+# depth, so quick static-evaluation results are shown at once and replaced
+# as deeper ones come in. By default they are posted to the pygame event
+# queue as HINT_EVENT events with the Hints as their hints attribute.
+#
+# Starting a new request cancels the one before. Every request has a
+# generation number, unique across workers, so results that were delivered
+# before the cancel took effect can be told apart and ignored.
+
+HINT_EVENT = pygame.USEREVENT + 2
+
+_generations = itertools.count(1)
+
+# Ranking of plays after searching them to depth. plays holds (value, play)
+# pairs, best first, with the value as an equity for the player on roll.
+# done is True for the last ranking of a request.
+Hints = collections.namedtuple('Hints', 'generation depth plays done')
+
+
+def postHints(hints):
+    """Posts hints to the pygame event queue, which is safe to do from any
+    thread."""
+    pygame.event.post(pygame.event.Event(HINT_EVENT, hints=hints))
+
+
+class _CancellableSearch(search.ExpectiminimaxSearch):
+    """Search that stops at its next node once cancelled is set. The
+    plays are ordered at depth 1 by _orderedChildren, which takes the die
+    numbers still to be played, as the user may have moved some checkers
+    already."""
+
+    def __init__(self, evaluator, cancelled):
+        search.ExpectiminimaxSearch.__init__(self, evaluator)
+        self.cancelled = cancelled
+
+    def _checkTime(self):
+        if self.cancelled.is_set():
+            raise search.SearchTimeout()
+        search.ExpectiminimaxSearch._checkTime(self)
+
+    def rank(self, children, depth):
+        """Searches every one of children to depth, which is at least 2, and
+        returns them sorted best first. Unlike _searchRoot, which only needs
+        the best play, every value is exact rather than a bound."""
+        scored = []
+        for score, play, child, terminal in children:
+            if terminal:
+                value = score
+            else:
+                value = -self._chance(child, depth - 1, -WIN, -LOSS)
+            scored.append((value, play, child, terminal))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+
+class HintWorker:
+    """Runs one hint request at a time on a background thread. maxDepth is
+    the deepest search made, and deliver is called with each Hints from the
+    worker thread."""
+
+    def __init__(self, evaluator=None, maxDepth=2, deliver=postHints):
+        self.evaluator = evaluator
+        self.maxDepth = maxDepth
+        self.deliver = deliver
+        self.generation = None
+        self.cancelled = None
+        self.thread = None
+
+    def start(self, state, numbers):
+        """Cancels the request in progress, if any, and starts ranking the
+        plays of numbers for the player on roll in state. Returns the new
+        request's generation number."""
+        self.cancel()
+        self.generation = next(_generations)
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, args=(state.copy(), list(numbers),
+                                   self.generation, self.cancelled),
+            daemon=True)
+        self.thread.start()
+        return self.generation
+
+    def cancel(self):
+        """Stops the request in progress. Its thread finishes at the next
+        node it searches and delivers nothing more."""
+        if self.cancelled is not None:
+            self.cancelled.set()
+            self.cancelled = None
+
+    def isBusy(self):
+        """Returns True while a request's thread is still running."""
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self, state, numbers, generation, cancelled):
+        """Ranks the plays depth by depth, delivering each ranking, until
+        maxDepth is done or the request is cancelled."""
+        ranker = _CancellableSearch(self.evaluator, cancelled)
+        children = ranker._orderedChildren(state, numbers)
+        for depth in range(1, self.maxDepth + 1):
+            if depth > 1:
+                try:
+                    children = ranker.rank(children, depth)
+                except search.SearchTimeout:
+                    return
+            # Searching deeper cannot change a forced or winning play
+            done = depth == self.maxDepth or len(children) <= 1 or \
+                   children[0][0] == WIN
+            if cancelled.is_set():
+                return
+            plays = [(value, play) for value, play, child, terminal
+                     in children]
+            self.deliver(Hints(generation, depth, plays, done))
+            if done:
+                return
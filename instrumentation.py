@@ -0,0 +1,304 @@
+import collections
+import functools
+import json
+import time
+
+import pygame
+
+import boardObjects
+import graphicalObjects
+
+# Opt-in timing and counting of the game's hot paths. Nothing in the game
+# calls into this module: enabling it replaces the methods and pygame
+# functions below with wrappers that record into a Registry, and disabling it
+# puts the originals back, so a game that never enables it pays nothing.
+#
+#   click       Board.checkClick, from the click's dispatch until the display
+#               update it causes has been pushed
+#   drawBoard   Board.drawBoard, the full redraws
+#   drawRegion  Board.drawRegion, the partial redraws, including the one
+#               inside every full redraw
+#   Dice.roll and changeTurn
+#   frame       one pass of the main loop, from receiving its events until it
+#               asks for more, not counting the time spent waiting for them
+#   idle        time spent waiting for events
+#   flip and update   full and partial pushes to the display
+#
+# Each click and frame also records how many redraws and display pushes it
+# caused, under names like 'click.drawRegion' and 'frame.flip'.
+
+# Summary of a list of recorded values. count is every value recorded and
+# the rest are over the most recent ones kept.
+Summary = collections.namedtuple('Summary', 'count mean p50 p90 p99 max')
+
+# Counters snapshotted around each click and frame
+_PER_EVENT = ('drawBoard', 'drawRegion', 'flip', 'update')
+
+OVERLAY_POSITION = (4, 424)
+OVERLAY_SIZE = (136, 72)
+OVERLAY_FONT_SIZE = 10
+OVERLAY_INTERVAL = 0.25 #seconds between overlay text refreshes
+
+
+def _percentile(values, fraction):
+    """Returns the value at fraction through the sorted list values."""
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class Registry:
+    """In-process store of counters and recorded values. Only the last keep
+    values of each name are held, so it can run for a whole session."""
+
+    def __init__(self, keep=1000):
+        self.keep = keep
+        self.counters = collections.Counter()
+        self.values = {}
+        self.recorded = collections.Counter()
+
+    def count(self, name, amount=1):
+        """Adds amount to the counter name."""
+        self.counters[name] += amount
+
+    def record(self, name, value):
+        """Adds a value, usually a duration in seconds, to name."""
+        values = self.values.get(name)
+        if values is None:
+            values = self.values[name] = collections.deque(maxlen=self.keep)
+        values.append(value)
+        self.recorded[name] += 1
+
+    def last(self, name):
+        """Returns the most recent value recorded for name, or None."""
+        values = self.values.get(name)
+        if not values:
+            return None
+        return values[-1]
+
+    def summary(self, name):
+        """Returns the Summary of the values recorded for name, or None."""
+        values = self.values.get(name)
+        if not values:
+            return None
+        ordered = sorted(values)
+        return Summary(self.recorded[name], sum(ordered) / len(ordered),
+                       _percentile(ordered, 0.5), _percentile(ordered, 0.9),
+                       _percentile(ordered, 0.99), ordered[-1])
+
+    def reset(self):
+        """Forgets everything recorded so far."""
+        self.counters.clear()
+        self.values.clear()
+        self.recorded.clear()
+
+    def snapshot(self):
+        """Returns the counters, summaries and kept values as plain data."""
+        return {'counters': dict(self.counters),
+                'summaries': dict((name, self.summary(name)._asdict())
+                                  for name in self.values),
+                'values': dict((name, list(values))
+                               for name, values in self.values.items())}
+
+    def dump(self, path):
+        """Writes the snapshot to path as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+
+
+class Overlay:
+    """Box in a corner of the screen showing the latest figures. It is drawn
+    over the board just before each push to the display."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.rect = pygame.Rect(OVERLAY_POSITION, OVERLAY_SIZE)
+        self.lines = []
+        self.refreshed = 0.0
+
+    def text(self):
+        """Returns the lines to show."""
+        registry = self.registry
+        lines = []
+        click = registry.last('click')
+        if click is not None:
+            lines.append('click %.1fms, %d redraws' % (
+                click * 1e3, registry.last('click.drawRegion')))
+        frame = registry.summary('frame')
+        if frame is not None:
+            lines.append('frame p50 %.1f p99 %.1fms' % (frame.p50 * 1e3,
+                                                        frame.p99 * 1e3))
+        lines.append('full %d partial %d' % (registry.counters['drawBoard'],
+                                             registry.counters['drawRegion']))
+        lines.append('flip %d update %d' % (registry.counters['flip'],
+                                            registry.counters['update']))
+        return lines
+
+    def draw(self, surface):
+        """Draws the box to surface, refreshing its text every
+        OVERLAY_INTERVAL seconds."""
+        now = time.perf_counter()
+        if now - self.refreshed >= OVERLAY_INTERVAL:
+            font = graphicalObjects.getFont(OVERLAY_FONT_SIZE)
+            self.lines = [font.render(line, 1, graphicalObjects.WHITE)
+                          for line in self.text()]
+            self.refreshed = now
+        surface.fill(graphicalObjects.BLACK, self.rect)
+        y = self.rect.top + 2
+        for label in self.lines:
+            surface.blit(label, (self.rect.left + 2, y))
+            y += label.get_height()
+
+
+class Instrumentation:
+    """Installs and removes the wrappers that feed a Registry."""
+
+    def __init__(self, registry=None, overlay=False):
+        if registry is None:
+            registry = Registry()
+        self.registry = registry
+        self.overlay = Overlay(registry) if overlay else None
+        self.originals = []
+        self.frameStart = None
+        self.frameCounts = {}
+
+    def isEnabled(self):
+        """Returns True while the wrappers are installed."""
+        return bool(self.originals)
+
+    def _replace(self, owner, name, wrapper):
+        """Replaces owner.name with wrapper(original), remembering the
+        original."""
+        original = getattr(owner, name)
+        self.originals.append((owner, name, original))
+        setattr(owner, name, functools.wraps(original)(wrapper(original)))
+
+    def enable(self, boardClass):
+        """Starts recording. boardClass is the Board class the game uses,
+        which is main.Board, or __main__.Board when main.py is run as a
+        script."""
+        if self.isEnabled():
+            return
+        self._replace(boardClass, 'checkClick', self._perEvent('click'))
+        self._replace(boardClass, 'drawBoard', self._timed('drawBoard'))
+        self._replace(boardClass, 'drawRegion', self._timed('drawRegion'))
+        self._replace(boardClass, 'changeTurn', self._timed('changeTurn'))
+        self._replace(boardObjects.Dice, 'roll', self._timed('Dice.roll'))
+        self._replace(pygame.display, 'flip', self._flip)
+        self._replace(pygame.display, 'update', self._update)
+        self._replace(pygame.event, 'wait', self._eventWait)
+        self._replace(pygame.event, 'get', self._eventWait)
+
+    def disable(self):
+        """Stops recording and restores everything that was wrapped."""
+        while self.originals:
+            owner, name, original = self.originals.pop()
+            setattr(owner, name, original)
+        self.frameStart = None
+
+    def _timed(self, name):
+        """Returns a wrapper factory that counts calls and records their
+        durations under name."""
+        registry = self.registry
+        clock = time.perf_counter
+        def wrapper(function):
+            def timed(*args, **kwargs):
+                registry.counters[name] += 1
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    registry.record(name, clock() - start)
+            return timed
+        return wrapper
+
+    def _perEvent(self, name):
+        """Returns a wrapper factory like _timed that also records how many
+        redraws and display pushes each call caused."""
+        registry = self.registry
+        clock = time.perf_counter
+        def wrapper(function):
+            def timed(*args, **kwargs):
+                counters = registry.counters
+                before = [counters[counter] for counter in _PER_EVENT]
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    registry.record(name, clock() - start)
+                    for counter, count in zip(_PER_EVENT, before):
+                        registry.record(name + '.' + counter,
+                                        counters[counter] - count)
+            return timed
+        return wrapper
+
+    def _flip(self, function):
+        """Wrapper factory for pygame.display.flip."""
+        registry = self.registry
+        overlay = self.overlay
+        def flip():
+            registry.counters['flip'] += 1
+            if overlay is not None:
+                overlay.draw(pygame.display.get_surface())
+            function()
+        return flip
+
+    def _update(self, function):
+        """Wrapper factory for pygame.display.update, which is a full push
+        when called without rectangles."""
+        registry = self.registry
+        overlay = self.overlay
+        def update(rects=None):
+            if isinstance(rects, pygame.Rect):
+                rects = [rects]
+            if rects is None:
+                registry.counters['flip'] += 1
+            else:
+                registry.counters['update'] += 1
+            if overlay is not None:
+                overlay.draw(pygame.display.get_surface())
+                if rects is not None:
+                    rects = list(rects) + [overlay.rect]
+            if rects is None:
+                function()
+            else:
+                function(rects)
+        return update
+
+    def _eventWait(self, function):
+        """Wrapper factory for the main loop's event calls. The time between
+        one call returning and the next starting is a frame."""
+        registry = self.registry
+        clock = time.perf_counter
+        def wait(*args, **kwargs):
+            start = clock()
+            if self.frameStart is not None:
+                registry.record('frame', start - self.frameStart)
+                counters = registry.counters
+                for counter in _PER_EVENT:
+                    registry.record('frame.' + counter, counters[counter]
+                                    - self.frameCounts.get(counter, 0))
+            result = function(*args, **kwargs)
+            self.frameStart = clock()
+            self.frameCounts = dict(registry.counters)
+            registry.record('idle', self.frameStart - start)
+            return result
+        return wait
+
+    def report(self):
+        """Returns a multi-line description of everything recorded."""
+        registry = self.registry
+        lines = []
+        for name in sorted(registry.values):
+            summary = registry.summary(name)
+            if '.' in name and name.split('.')[0] in ('click', 'frame'):
+                lines.append('%-22s %7d  mean %6.2f  p50 %4g  p99 %4g  max %4g'
+                             % (name, summary.count, summary.mean,
+                                summary.p50, summary.p99, summary.max))
+            else:
+                lines.append('%-22s %7d  mean %7.3fms  p50 %7.3fms  '
+                             'p99 %7.3fms  max %7.3fms'
+                             % (name, summary.count, summary.mean * 1e3,
+                                summary.p50 * 1e3, summary.p99 * 1e3,
+                                summary.max * 1e3))
+        for name in sorted(registry.counters):
+            lines.append('%-22s %7d' % (name, registry.counters[name]))
+        return '\n'.join(lines)
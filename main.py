@@ -1,6 +1,15 @@
+import argparse
 import pygame
 import boardObjects
+import diceSource
 import graphicalObjects
+import gameRecord
+import gameState
+import gnubgId
+import hintWorker
+import moveGeneration
+import positionHistory
+import search
 
 # Board dimension constants
 WIN_LENGTH = 900
@@ -22,15 +31,54 @@ BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 
+IDLE_TIMEOUT = 1000 #longest wait for an event in milliseconds
+
 
 class Board:
     """Top-level class for the backgammon game. Contains all the game objects as
        attributes."""
 
-    def __init__(self, surface):
+    def __init__(self, surface, computerPlayers=(), thinkTime=1.0,
+                 evaluator=None, recorder=None, state=None, dice=None,
+                 hints=False):
 
         self.won = False
         self.surface = surface
+
+        # Whether the game has been won. Unlike won, which is only True while
+        # the winner is shown, it stays True while the finished game is
+        # stepped through, and no more moves are made.
+        self.finished = False
+
+        # Whether the plays of the person on roll are ranked in the
+        # background and shown on the points they may move to. hintPlays is
+        # the latest ranking of the request hintGeneration and hintLabels
+        # the labels it gives the highlighted points.
+        self.hints = hints
+        self.hintWorker = hintWorker.HintWorker(evaluator)
+        self.hintGeneration = None
+        self.hintPlays = []
+        self.hintLabels = []
+
+        # Whether the GNU Backgammon ID of the position shown is displayed
+        # in the bottom left corner, and the texts showing it
+        self.showId = False
+        self.idTexts = []
+
+        # Optional gameRecord writer that every roll and move is sent to
+        self.recorder = recorder
+
+        # Every position of the game so far, for undo and redo
+        self.history = positionHistory.PositionHistory()
+
+        # Screen rectangles that have changed since the display was updated
+        self.dirty = []
+
+        # Headless position that the graphical objects below are a view of,
+        # the starting position unless another state is given
+        if state is None:
+            state = gameState.GameState()
+        self.state = state.copy()
         self.background = graphicalObjects.Rectangle(B_WIDTH, B_HEIGHT, (int(WIN_CENTER[0]-B_WIDTH/2), int(WIN_CENTER[1]-B_HEIGHT/2)), GREEN)
         self.outer = graphicalObjects.Rectangle(B_WIDTH + 40, B_HEIGHT + 38, (int(WIN_CENTER[0] - (B_WIDTH + 40)/2), int(WIN_CENTER[1] - (B_HEIGHT + 38)/2)), BROWN)
 
@@ -42,20 +90,24 @@ class Board:
         # Creates the box where checkers are placed when they leave the board
         self.checkerBox = boardObjects.CheckerBox(self.surface)
 
-        # Creates the players and sets the first turn to red
+        # Creates the players and sets the first turn to red. Players whose
+        # index is in computerPlayers are controlled by the search.
         self.players = []
-        for color in [RED, WHITE]:
-            self.players.append(Player(color, self))
-        self.currentPlayer = 0
+        for index, color in enumerate([RED, WHITE]):
+            if index in computerPlayers:
+                self.players.append(AIPlayer(color, self, thinkTime,
+                                             evaluator))
+            else:
+                self.players.append(Player(color, self))
 
         # Creates message which displays who's turn it is
         self.message = graphicalObjects.Text\
                        ('It\'s ' + self.getCurrentString() 
                         + '\'s turn!', (20, 60), 12, WHITE)
         
-        # Creates the game dice
+        # Creates the game dice, rolling from the diceSource dice if given
 
-        self.dice = boardObjects.Dice(self, self.surface)
+        self.dice = boardObjects.Dice(self, self.surface, dice)
 
 
         # Creates a list that contains all the board points
@@ -97,18 +149,10 @@ class Board:
                         self.dice, BLACK, self.surface))
 
 
-        # Places checkers on the points for starting game position
-        for _ in range(2):
-            self.points[0].addChecker(boardObjects.Checker(RED))
-            self.points[23].addChecker(boardObjects.Checker(WHITE))
-        for _ in range(3):
-            self.points[7].addChecker(boardObjects.Checker(WHITE))
-            self.points[16].addChecker(boardObjects.Checker(RED))
-        for _ in range(5):
-            self.points[5].addChecker(boardObjects.Checker(WHITE))
-            self.points[11].addChecker(boardObjects.Checker(RED))
-            self.points[12].addChecker(boardObjects.Checker(WHITE))
-            self.points[18].addChecker(boardObjects.Checker(RED))
+        # Places a checker object for every checker in the position. The
+        # checkers are drawn as one sprite group.
+        self.checkers = pygame.sprite.LayeredDirty()
+        self.placeCheckers()
 
         self.pointsSetUp()
 
@@ -123,7 +167,26 @@ class Board:
         # Creates button that changes turns and indicates who's turn it is
         self.turnchanger = boardObjects.TurnChanger(self)
 
-        self.turnchanger.draw(self.surface)
+        # Maps every pixel to the clickable object there, if any
+        self.hitGrid = graphicalObjects.HitGrid(WIN_LENGTH, WIN_HEIGHT)
+        self.dice.addHitArea(self.hitGrid)
+        self.turnchanger.addHitArea(self.hitGrid)
+        for point in self.points:
+            point.addHitArea(self.hitGrid)
+
+        # The frame, background, triangles, bars and checker box never move,
+        # so they are drawn once here and copied to the screen from then on.
+        # The board layer adds the highlighted triangles and is what the
+        # checker sprites are drawn over.
+        self.staticLayer = self.renderStaticLayer()
+        self.boardLayer = self.staticLayer.copy()
+        self.checkers.clear(self.surface, self.boardLayer)
+        # The group's first draw covers the whole screen with the board layer,
+        # so it is done before anything else is drawn. After that it never
+        # falls back to full-screen redraws, which would erase everything
+        # that is not part of the board layer.
+        self.checkers.set_timing_threshold(float('inf'))
+        self.checkers.draw(self.surface)
 
         # Adds point list to each player
         for player in self.players:
@@ -131,34 +194,324 @@ class Board:
 
         self.drawBoard()
 
+        if self.recorder is not None:
+            self.recorder.startGame(self.state)
+        self.pushHistory()
+
+    def placeCheckers(self):
+        """Replaces all the checkers with one for every checker in the game
+        state, on its point, on the bar or in the checker box."""
+        self.checkers.empty()
+        for point in self.points:
+            point.clearCheckers()
+        for bar in self.bar:
+            bar.clearCheckers()
+        self.checkerBox.clearCheckers()
+
+        for i, point in enumerate(self.points):
+            owner = self.state.owner(i)
+            for _ in range(self.state.count(i)):
+                checker = boardObjects.Checker(self.players[owner].getColor())
+                point.addChecker(checker)
+                self.checkers.add(checker)
+        for index, player in enumerate(self.players):
+            for _ in range(self.state.barCount(index)):
+                checker = boardObjects.Checker(player.getColor())
+                self.bar[index].addChecker(checker)
+                self.checkers.add(checker)
+            for _ in range(self.state.offCount(index)):
+                checker = boardObjects.Checker(player.getColor())
+                self.checkerBox.addChecker(checker)
+                self.checkers.add(checker)
+        for bar in self.bar:
+            bar.organize()
+            bar.update()
+            bar.setActiveTurn()
+
+    def loadState(self, state):
+        """Shows a copy of state in place of the game in progress, with the
+        player on roll in state about to roll the dice."""
+        self.showState(state)
+        if self.recorder is not None:
+            self.recorder.startGame(self.state)
+        self.history.clear()
+        self.pushHistory()
+
+    def showState(self, state, dice=None, numbers=()):
+        """Rebuilds the view to show a copy of state. If dice is given, the
+        player on roll has rolled it and has numbers left to play, otherwise
+        they are about to roll."""
+        for point in self.points:
+            point.reset()
+        self.state = state.copy()
+        self.won = False
+        self.clickedPiece = None
+        self.diceNumbers = []
+        self.placeCheckers()
+        self.organizeAndUpdate()
+        self.setPointsToTurn()
+        self.dice.makeActive()
+        if dice is not None:
+            self.dice.show(*dice)
+            self.diceNumbers = list(numbers)
+            self.possibleBarMoves()
+        self.message.setText('It\'s ' + self.getCurrentString() + '\'s turn!')
+        self.turnchanger.setFillColor(self.getTurn())
+        self.drawBoard()
+
+    def pushHistory(self):
+        """Adds the current position, dice and numbers left to the
+        history."""
+        mark = 0
+        if self.recorder is not None:
+            mark = self.recorder.mark()
+        self.history.push(self.state, (self.dice.die1_num, self.dice.die2_num),
+                          self.diceNumbers, not self.dice.isActive(), mark)
+        self.updateHints()
+
+    def setHints(self, hints):
+        """Turns hints on or off."""
+        self.hints = hints
+        self.updateHints()
+        self.updateDisplay()
+
+    def updateHints(self):
+        """Called whenever the position or the numbers left change. Drops
+        the hints for the old position and, if hints are on and a person is
+        to play, starts ranking the plays of the new one."""
+        self.cancelHints()
+        if self.hints and self.diceNumbers and not self.finished and \
+           not self.players[self.currentPlayer].isComputer():
+            self.hintGeneration = self.hintWorker.start(self.state,
+                                                        self.diceNumbers)
+
+    def cancelHints(self):
+        """Stops ranking plays and forgets the ranking shown."""
+        self.hintWorker.cancel()
+        self.hintGeneration = None
+        self.hintPlays = []
+
+    def showHints(self, hints):
+        """Shows a ranking delivered by the hint worker, unless it is for a
+        position that is no longer shown."""
+        if hints.generation != self.hintGeneration:
+            return
+        self.hintPlays = hints.plays
+        self.updateDisplay()
+
+    def setShowId(self, showId):
+        """Turns the display of the position's GNU Backgammon ID on or
+        off."""
+        self.showId = showId
+        self.updateDisplay()
+
+    def refreshIdTexts(self):
+        """Shows the Position ID and Match ID of the position on two lines
+        while showId is set, so it can be set up in GNU Backgammon. The
+        rectangles of texts that change are marked dirty."""
+        texts = []
+        if self.showId:
+            for line, string in enumerate(gnubgId.encode(self.state)
+                                          .split(':')):
+                texts.append(graphicalObjects.Text(
+                    string, (13, WIN_HEIGHT - 50 + 16 * line), 11, YELLOW))
+        if [text.string for text in texts] != \
+           [text.string for text in self.idTexts]:
+            for text in self.idTexts + texts:
+                self.markDirty(text.getRect())
+            self.idTexts = texts
+
+    def refreshHintLabels(self):
+        """Labels each highlighted point with the rank and equity of the
+        best play that moves the clicked checker, or one from the bar, there.
+        The rectangles of labels that change are marked dirty."""
+        labels = []
+        if self.hintPlays:
+            if not self.isCurrentBarEmpty():
+                start = gameState.BAR
+            else:
+                start = self.clickedPiece
+            for point in self.points:
+                if start is None or not point.isValidMove:
+                    continue
+                move = (start, point.getNumber())
+                for rank, (value, play) in enumerate(self.hintPlays):
+                    if move in play:
+                        labels.append(self.hintLabel(point, rank + 1, value))
+                        break
+        if [(label.string, label.position) for label in labels] != \
+           [(label.string, label.position) for label in self.hintLabels]:
+            for label in self.hintLabels + labels:
+                self.markDirty(label.getRect())
+            self.hintLabels = labels
+
+    def hintLabel(self, point, rank, value):
+        """Returns the Text labelling point with a play's rank and value,
+        placed just inside the tip of its triangle."""
+        string = '%d %+.2f' % (rank, value)
+        if point.side == 'bottom':
+            position = (int(point.x - T_WIDTH + 2),
+                        int(point.y - T_HEIGHT + 4))
+        else:
+            position = (int(point.x + 2), int(point.y + T_HEIGHT - 16))
+        return graphicalObjects.Text(string, position, 11, YELLOW)
+
+    def drawHintLabels(self, rects):
+        """Draws the hint labels that overlap any of rects over the
+        checkers, on a black background so they can be read on any of
+        them."""
+        for label in self.hintLabels:
+            rect = label.getRect()
+            if rect.collidelist(rects) != -1:
+                self.surface.fill(BLACK, rect)
+                label.draw(self.surface)
+
+    def jumpTo(self, ply):
+        """Shows ply of the history, counting from 0 for the start of the
+        game. Taking a turn from there discards the plies after it."""
+        snapshot = self.history.snapshot(ply)
+        self.history.position = ply
+        self.showState(snapshot.state,
+                       snapshot.dice if snapshot.rolled else None,
+                       snapshot.numbers)
+        if self.state.isWon(self.currentPlayer):
+            self.showWinner()
+        self.updateHints()
+
+    def isComputerMidTurn(self, ply):
+        """Returns True if the computer has rolled and is partway through
+        its turn at ply, which undo and redo step over."""
+        snapshot = self.history.snapshot(ply)
+        return snapshot.rolled and \
+            self.players[snapshot.state.currentPlayer].isComputer()
+
+    def undo(self):
+        """Goes back to the previous ply at which a person is to act."""
+        ply = self.history.position - 1
+        while ply > 0 and self.isComputerMidTurn(ply):
+            ply -= 1
+        if ply >= 0:
+            self.jumpTo(ply)
+
+    def redo(self):
+        """Goes forward to the next ply at which a person is to act, or to
+        the last ply."""
+        ply = self.history.position + 1
+        last = len(self.history) - 1
+        while ply < last and self.isComputerMidTurn(ply):
+            ply += 1
+        if ply <= last:
+            self.jumpTo(ply)
+
+    def isReviewing(self):
+        """Returns True while an earlier ply than the last is shown. The
+        computer does not play until the game goes on from there."""
+        return not self.history.isLatest()
+
+    def goOnFromHere(self):
+        """Called before a roll, move or change of turn is recorded. If an
+        earlier ply is shown, the plies and recorded events after it are
+        discarded, since the game now goes on from there instead."""
+        if self.history.isLatest():
+            return
+        snapshot = self.history.snapshot(self.history.position)
+        self.history.truncate()
+        if self.recorder is not None:
+            self.recorder.rewind(snapshot.mark)
+
     def isGameWon(self):
         # Returns true if the game is won
         return self.won
 
+    def isFinished(self):
+        """Returns True once the game has been won, even while an earlier
+        ply of it is shown."""
+        return self.finished
+
     def drawBoard(self):
         """Draws all the board's graphical objects to the surface and
-           updates the display."""
-        self.outer.draw(self.surface)
-        self.background.draw(self.surface)
+           updates the whole display."""
+        self.refreshHintLabels()
+        self.refreshIdTexts()
+        self.drawRegion(self.surface.get_rect())
+        self.checkers.draw(self.surface)
+        self.drawHintLabels([self.surface.get_rect()])
+        self.dirty = []
+        pygame.display.flip()
+
+    def drawRegion(self, rect):
+        """Redraws the part of the board inside rect, drawing only the
+        objects that overlap it. The checkers there are marked so the next
+        draw of the checker group puts them back on top."""
+        self.boardLayer.set_clip(rect)
+        self.boardLayer.blit(self.staticLayer, rect, rect)
+        for point in self.points:
+            if point.isHighlighted() and rect.colliderect(point.getRect()):
+                point.drawHighlight(self.boardLayer)
+        self.boardLayer.set_clip(None)
+
+        self.surface.set_clip(rect)
+        self.surface.blit(self.boardLayer, rect, rect)
+        if rect.colliderect(self.dice.getRect()):
+            self.dice.draw(self.surface)
+        if rect.colliderect(self.message.getRect()):
+            self.message.draw(self.surface)
+        if rect.colliderect(self.turnchanger.getRect()):
+            self.turnchanger.draw(self.surface)
+        for text in self.idTexts:
+            if rect.colliderect(text.getRect()):
+                text.draw(self.surface)
+        self.surface.set_clip(None)
+        for checker in self.checkers:
+            if rect.colliderect(checker.rect):
+                checker.dirty = 1
+
+    def renderStaticLayer(self):
+        """Returns a surface holding the parts of the board that never
+        change: the frame, the background, the triangles with plain borders,
+        the bars and the checker box."""
+        layer = pygame.Surface(self.surface.get_size(), 0, self.surface)
+        layer.fill(BLACK)
+        self.outer.draw(layer)
+        self.background.draw(layer)
         for point in self.points:
-            point.draw(self.surface)
-            point.drawCheckers(self.surface)
-        self.dice.draw(self.surface)
-        self.message.draw(self.surface)
-        self.checkerBox.draw(self.surface)
-        self.checkerBox.drawCheckers(self.surface)
+            point.draw(layer)
+        self.checkerBox.draw(layer)
         for bar in self.bar:
-            bar.draw(self.surface)
-            bar.drawCheckers(self.surface)
-        pygame.display.flip()
+            bar.draw(layer)
+        return layer
+
+    def markDirty(self, rect):
+        """Marks rect as changed so the next updateDisplay redraws it."""
+        if rect not in self.dirty:
+            self.dirty.append(rect)
+
+    def updateDisplay(self):
+        """Redraws the changed rectangles and pushes only those to the
+        display."""
+        if self.won:
+            self.dirty = []
+            return
+        self.refreshHintLabels()
+        self.refreshIdTexts()
+        for rect in self.dirty:
+            self.drawRegion(rect)
+        # The group clears and redraws only the checkers that moved or were
+        # drawn over, and returns the rectangles it touched. Hint labels go
+        # on top of them.
+        rects = self.dirty + self.checkers.draw(self.surface)
+        self.drawHintLabels(rects)
+        if rects:
+            pygame.display.update(rects)
+        self.dirty = []
 
     def checkClick(self, pos):
         """Checks to see if a player has clicked on any of the
            interractive board elements."""
-        self.dice.checkClick(pos)
-        self.turnchanger.checkClick(pos)
-        for point in self.points:
-            point.checkClick(pos)
+        widget = self.hitGrid.lookup(pos)
+        if widget is not None:
+            widget.handleMouseRelease()
+        self.updateDisplay()
 
     def getCurrentString(self):
         """Returns string corresponding to current player's color."""
@@ -168,40 +521,42 @@ class Board:
 
     def checkWinner(self, surface):
         """Checks whether the current player has cleared all checkers."""
-        winner = True
-        
-        # Checks for winner
-        for point in self.points:
-            if point.getTeam() == self.getTurn():
-                winner = False
-        
         # Displays winner message if there is a winner
-        if winner:
-            self.surface.fill(BLACK)
-            winText = graphicalObjects.Text(self.getCurrentString() + ' wins!', WIN_CENTER, 20)
-            winText.draw(self.surface)
-            pygame.display.flip()
-            self.won = True
+        if self.state.isWon(self.currentPlayer):
+            self.cancelHints()
+            self.showWinner()
+            self.finished = True
+            if self.recorder is not None:
+                self.recorder.endGame(self.currentPlayer)
+
+    def showWinner(self):
+        """Replaces the board with the winner message."""
+        self.surface.fill(BLACK)
+        winText = graphicalObjects.Text(self.getCurrentString() + ' wins!', WIN_CENTER, 20)
+        winText.draw(self.surface)
+        restartText = graphicalObjects.Text('Click or press any key to play again', (WIN_CENTER[0], WIN_CENTER[1] + 30), 12, WHITE)
+        restartText.draw(self.surface)
+        reviewText = graphicalObjects.Text('Arrow keys look back over the game', (WIN_CENTER[0], WIN_CENTER[1] + 50), 12, WHITE)
+        reviewText.draw(self.surface)
+        pygame.display.flip()
+        self.won = True
+
+    def recordRoll(self, die1, die2):
+        """Sends a roll of the dice to the recorder, if there is one."""
+        self.goOnFromHere()
+        if self.recorder is not None:
+            self.recorder.roll(die1, die2)
+
+    def recordMove(self, start, end):
+        """Sends a checker move to the recorder, if there is one."""
+        self.goOnFromHere()
+        if self.recorder is not None:
+            self.recorder.move(start, end)
 
     def isCurrentPlayerHome(self):
-        """Returns True if the current player's checkers are all home by
-        checking whether the current player has checkers in any pieces that are
-        not in the home area.."""
-        
-        #creates corresponding starting and ending points for each player
-        if self.getTurn() == RED:
-            start = 0
-            end = 18
-        else:
-            start = 6
-            end = 24
-        
-        #checks whether the current player has checkers on corresponding points
-        for i in range(start, end):
-            if self.points[i].getTeam() == self.getTurn():
-                return False
-        
-        return True
+        """Returns True if the current player's checkers are all home, in
+        which case they may be borne off."""
+        return self.state.isHome(self.currentPlayer)
     
     def getDiceNumbers(self):
         """Updates the diceNumbers list to match the current dice numbers."""
@@ -211,11 +566,10 @@ class Board:
 
     def pointsSetUp(self):
         """Performs important setup methods for points."""
-        self.background.draw(self.surface)
         for i in range(len(self.points)):
+            self.points[i].addNumber(i)
             self.points[i].organize()
             self.points[i].update()
-            self.points[i].addNumber(i)
             self.points[i].setActiveTurn()   
 
     def organizeAndUpdate(self):
@@ -237,6 +591,11 @@ class Board:
     def getCurrentPlayer(self):
         """Returns the index integer representing the current player."""
         return self.currentPlayer
+
+    @property
+    def currentPlayer(self):
+        """Index of the current player, as held by the game state."""
+        return self.state.currentPlayer
         
     def isCurrentBarEmpty(self):
         """Returns true if the active player's bar is empty, false otherwise."""
@@ -254,73 +613,70 @@ class Board:
         
         # Changes by turn changing the currentPlayer index and updating all the 
         # necessary board objects
-        self.currentPlayer = (self.currentPlayer + 1) % 2
+        self.state.changeTurn()
+        self.goOnFromHere()
+        if self.recorder is not None:
+            self.recorder.changeTurn()
         self.dice.makeActive()
+        self.diceNumbers = []
         for point in self.points:
             point.setActiveTurn()
         for bar in self.bar:
             bar.update()
             bar.setActiveTurn()
-        self.message.resetText('It\'s ' + self.getCurrentString() + '\'s turn!', self.surface)
+        self.markDirty(self.message.getRect())
+        self.message.setText('It\'s ' + self.getCurrentString() + '\'s turn!')
+        self.markDirty(self.message.getRect())
         self.turnchanger.setFillColor(self.getTurn())
-        self.turnchanger.draw(self.surface)
-        pygame.display.flip()
+        self.markDirty(self.turnchanger.getRect())
+        self.pushHistory()
+        self.updateDisplay()
 
     def possibleMoves(self, startingPiece):
         """Determines the possible moves based on the clicked piece and the
         available numbers on the dice."""
         self.clickedPiece = startingPiece
-        for num in self.diceNumbers:
-            nextPoint = startingPiece + num * ((-1) ** self.currentPlayer)
-            
-            #sets points as valid moves if a move can be made to them from the
-            #clicked piece
-            if nextPoint < len(self.points) and nextPoint >= 0:
-                if self.points[nextPoint].isOpen()\
-                or self.points[nextPoint].isBlot()\
-                or self.points[nextPoint].getTeam() == self.getTurn():
-                    self.points[nextPoint].setValidMove(True)
-                    self.points[nextPoint].setBorder(RED, 3)
-                
+        
+        #sets points as valid moves if a legal play can start by moving the
+        #clicked piece to them
+        for start, end, num in self.legalFirstMoves():
+            if start == startingPiece and end != gameState.OFF:
+                self.points[end].setValidMove(True)
+                self.points[end].setBorder(RED, 3)
+
     def possibleBarMoves(self):
         """Determines the possible moves based on whether there are checkers in
         the current player's bar and the available numbers on the dice."""
         
         if not self.bar[self.currentPlayer].isEmpty(): 
-            # Creates point index for the corresponding current player
-            for num in self.diceNumbers:
-                if self.currentPlayer == 0:
-                    potentialPoint = num - 1
-                else: 
-                    potentialPoint = num * (-1) 
-                
-                # Sets points as valid moves if a move can be made to them from
-                # the bar
-                if self.points[potentialPoint].isOpen()\
-                or self.points[potentialPoint].isBlot()\
-                or self.points[potentialPoint].getTeam() == self.getTurn():
-                    self.points[potentialPoint].setValidMove(True)
-                    self.points[potentialPoint].setBorder(RED, 3)
+            # Sets points as valid moves if a checker can legally enter on
+            # them from the bar
+            for start, end, num in self.legalFirstMoves():
+                self.points[end].setValidMove(True)
+                self.points[end].setBorder(RED, 3)
+
+    def legalFirstMoves(self):
+        """Returns the (start, end, die) checker moves the current player may
+        make next with the dice numbers that are left."""
+        return moveGeneration.legalFirstMoves(self.state, self.diceNumbers)
 
     def undoPossibleMoves(self, startingPiece):
         """Resets all pieces that were possible moves from the previous
         clicked piece."""
         self.clickedPiece = None #Indicates that the board has no clicked piece
-        for num in self.diceNumbers:
-            nextPoint = startingPiece + num * ((-1) ** self.currentPlayer)
-            if nextPoint < len(self.points) and nextPoint >= 0:
-                self.points[nextPoint].setValidMove(False)
-                self.points[nextPoint].setBorder(BLACK, 1)
+        self.clearValidMoves()
     
     def undoPossibleBarMoves(self):
         """Resets all points that were previously possible moves from the bar"""
-        for num in self.diceNumbers:
-            if self.currentPlayer == 0:
-                potentialPoint = num - 1
-            else:
-                potentialPoint = num * (-1)
-            self.points[potentialPoint].setValidMove(False)
-            self.points[potentialPoint].setBorder(BLACK, 1)
+        self.clearValidMoves()
+
+    def clearValidMoves(self):
+        """Resets exactly the points that are highlighted as possible
+        moves."""
+        for point in self.points:
+            if point.isValidMove:
+                point.setValidMove(False)
+                point.setBorder(BLACK, 1)
     
     def moveChecker(self, point):
         """Moves checker from the clicked piece to point."""
@@ -333,6 +689,11 @@ class Board:
         point.getTeam() != self.points[clickedPiece].getTeam():
             self.pointHit(point)
         
+        # Applies the move to the game state, then mirrors it on the graphical
+        # checkers
+        self.state.moveChecker(clickedPiece, point.getNumber())
+        self.recordMove(clickedPiece, point.getNumber())
+
         # Adds checker to new point and updates the new point correspondingly
         point.addChecker(self.points[self.clickedPiece].returnChecker())
         point.organize()
@@ -353,8 +714,10 @@ class Board:
         # Changes turn if necessary
         if not len(self.diceNumbers):
             self.changeTurn()
+        else:
+            self.pushHistory()
 
-        self.drawBoard()
+        self.updateDisplay()
     
     def moveCheckerFromBar(self, point):
         """Moves checker from the bar to point."""
@@ -365,12 +728,13 @@ class Board:
         point.getTeam() != self.getTurn():
             self.pointHit(point)
         
+        self.state.moveCheckerFromBar(point.getNumber())
+        self.recordMove(gameState.BAR, point.getNumber())
+
         # Adds checker to the new point and organizes and updates that point
         point.addChecker(self.bar[self.currentPlayer].returnChecker())
         point.organize()
         point.update()
-        point.setBorder(BLACK, 1)
-        point.setValidMove(False)
         point.setActiveTurn()
         
         # Removes checker from bar and updates the bar accordingly
@@ -385,60 +749,79 @@ class Board:
         else:
             self.diceNumbers.remove(24 - point.getNumber())
         
+        # Removes possible moves from the bar now that the move has been made
+        self.undoPossibleBarMoves()
+
         # Changes turn if necessary
         if not len(self.diceNumbers):
             self.changeTurn()
             return
+        self.pushHistory()
 
-        self.bar[self.getCurrentPlayer()].draw(self.surface)
-        self.bar[self.getCurrentPlayer()].drawCheckers(self.surface)
-        pygame.display.update()
-        
-        # Removes possible moves from the bar now that the move has been made
-        if self.bar[self.currentPlayer].isEmpty():
-            self.undoPossibleBarMoves()
+        # Shows where the next checker can enter, if any are left
+        self.possibleBarMoves()
+        self.updateDisplay()
     
-    def attemptBearOff(self, point):
-        """Bears checker off if possible. Returns True if bear off occurs."""
+    def attemptBearOff(self, point, num=None):
+        """Bears checker off if possible. Returns True if bear off occurs. If
+        num is given, only that dice number may be used."""
         
-        # Creates the values to be compared to dice numbers for both teams
-        for num in self.diceNumbers:
-            if self.getTurn() == RED:
-                compare = 24 - point.getNumber()
+        # Finds the dice numbers that may legally bear off from the point
+        numbers = [n for start, end, n in self.legalFirstMoves()
+                   if start == point.getNumber() and end == gameState.OFF
+                   and num in (None, n)]
+        
+        # If one of the dice numbers can be used, the point's checker piece
+        # leaves the board for good and is placed in the checkerBox,
+        # indicating that it is no longer in play
+        if numbers:
+            num = min(numbers)
+            self.state.bearOff(point.getNumber())
+            self.recordMove(point.getNumber(), gameState.OFF)
+            self.checkerBox.addChecker(point.returnChecker())
+            point.removeChecker()
+            point.organize()
+            point.update()
+            point.setActiveTurn()
+            self.diceNumbers.remove(num)
+            self.updateDisplay()
+            
+            # Checks whether the current player has won the game yet
+            self.checkWinner(self.surface)
+            
+            # Changes teams if all the dice numbers are used up. The winning
+            # position goes into the history too, so the game can be looked
+            # back on.
+            if not len(self.diceNumbers) and not self.isGameWon():
+                self.changeTurn()
             else:
-                compare = point.getNumber() + 1
+                self.pushHistory()
             
-            # If the dice number is sufficiently large enough, the point's 
-            # checker piece leaves the board for good and is placed in the 
-            # checkerBox, indicating that it is no longer in play
-            if num >= compare:
-                self.checkerBox.addChecker(point.returnChecker())
-                point.removeChecker()
-                point.organize()
-                point.update()
-                point.setActiveTurn()
-                self.diceNumbers.remove(num)
-                self.drawBoard()
-                
-                # Checks whether the current player has won the game yet
-                self.checkWinner(self.surface)
-                
-                # Changes teams if all the dice numbers are used up
-                if not len(self.diceNumbers) and not self.isGameWon():
-                    self.changeTurn()
-                
-                return True #This value indicates that bear off was successful
+            return True #This value indicates that bear off was successful
         
         return False
 
 
     def pointHit(self, point):
         """Removes current checker occupying point and adds it to the bar."""
+        self.state.pointHit(point.getNumber())
         self.bar[(self.currentPlayer + 1)%2].addChecker(point.returnChecker())
         self.bar[(self.currentPlayer + 1) % 2].organize()
         self.bar[(self.currentPlayer + 1) % 2].update()
         point.removeChecker()
     
+    def makeMove(self, start, end, num=None):
+        """Makes a single checker move as if the player had clicked it, where
+        start may be gameState.BAR and end gameState.OFF. num picks the dice
+        number used to bear off when more than one would do."""
+        if start == gameState.BAR:
+            self.moveCheckerFromBar(self.points[end])
+        elif end == gameState.OFF:
+            self.attemptBearOff(self.points[start], num)
+        else:
+            self.clickedPiece = start
+            self.moveChecker(self.points[end])
+
     def isPieceClicked(self):
         """Returns False if there is no clicked piece on the board and none 
         otherwise."""
@@ -468,18 +851,216 @@ class Player:
         """Returns the color corresponding to player."""
         return self.color
 
+    def isComputer(self):
+        """Returns True if the player's moves are chosen by the program."""
+        return False
 
-screen = pygame.display.set_mode((WIN_LENGTH, WIN_HEIGHT))
-clock = pygame.time.Clock()
-board = Board(screen)
-running = True
 
-# Game loop
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            board.checkClick(event.pos)
-    if board.isGameWon():
-        answer = input('Press any key to play again ')
-        board = Board(screen)
-    
+class AIPlayer(Player):
+    """A player whose moves are chosen by an expectiminimax search that
+    stops after thinkTime seconds. evaluator scores the positions searched
+    and defaults to the heuristic one."""
+    def __init__(self, color, board, thinkTime=1.0, evaluator=None):
+        Player.__init__(self, color, board)
+        self.search = search.ExpectiminimaxSearch(evaluator, maxDepth=3,
+                                                  timeBudget=thinkTime)
+
+    def isComputer(self):
+        """Returns True since the search chooses the player's moves."""
+        return True
+
+    def takeTurn(self):
+        """Rolls the dice and makes the play chosen by the search through the
+        same board methods a human's clicks use."""
+        board = self.board
+        player = board.getCurrentPlayer()
+        board.dice.roll()
+        dice = (board.dice.die1_num, board.dice.die2_num)
+        play, result = self.search.choosePlay(board.state, dice)
+
+        for start, end in play:
+            board.makeMove(start, end, self.bearOffNumber(start, end, result))
+
+        # Passes the turn on if some dice numbers could not be used
+        if not board.isGameWon() and board.getCurrentPlayer() == player:
+            board.changeTurn()
+
+    def bearOffNumber(self, start, end, result):
+        """Returns the dice number to bear off from start with so that the
+        rest of the play can still reach result, or None for other moves."""
+        if end != gameState.OFF:
+            return None
+        board = self.board
+        for start2, end2, num in board.legalFirstMoves():
+            if (start2, end2) != (start, end):
+                continue
+            state = board.state.copy()
+            state.moveChecker(start, end)
+            rest = list(board.diceNumbers)
+            rest.remove(num)
+            for play, reached in moveGeneration.legalPlaysForNumbers(state,
+                                                                     rest):
+                if reached == result:
+                    return num
+        return None
+
+
+def stepHistory(board, key):
+    """Steps through board's history if key is one of the history keys, and
+    returns whether it was."""
+    if key in (pygame.K_LEFT, pygame.K_z):
+        board.undo()
+    elif key in (pygame.K_RIGHT, pygame.K_y):
+        board.redo()
+    elif key == pygame.K_HOME:
+        board.jumpTo(0)
+    elif key == pygame.K_END:
+        board.jumpTo(len(board.history) - 1)
+    else:
+        return False
+    return True
+
+
+def main(argv=None):
+    """Runs the game in a window until it is closed."""
+    parser = argparse.ArgumentParser(description='Two-player backgammon.')
+    parser.add_argument('--computer', action='append', default=[],
+                        choices=['red', 'white'],
+                        help='let the computer play this color')
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help='seconds the computer may think per move')
+    parser.add_argument('--weights', default=None,
+                        help='trained network weights for the computer to use')
+    parser.add_argument('--fps', type=int, default=30,
+                        help='frame rate cap while the computer is playing')
+    parser.add_argument('--record', default=None,
+                        help='append every game played to this game record archive')
+    parser.add_argument('--position', default=None,
+                        help='start from this GNU Backgammon Position ID, '
+                        'optionally followed by :MatchID to say who is on roll')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='roll the dice of game N of the session from '
+                        'seed + N, so games can be reproduced')
+    parser.add_argument('--replay', default=None,
+                        help='replay the starting position and rolls of a '
+                        'game from this game record archive')
+    parser.add_argument('--game', type=int, default=0,
+                        help='number of the game to replay (default: 0)')
+    parser.add_argument('--profile', action='store_true',
+                        help='time clicks, redraws and frames and show the '
+                        'figures in a corner of the window')
+    parser.add_argument('--profile-dump', default=None,
+                        help='time clicks, redraws and frames and write the '
+                        'figures to this JSON file on exit')
+    parser.add_argument('--hints', action='store_true',
+                        help='rank your plays in the background and show the '
+                        'best ones on the points you may move to (toggle '
+                        'with h)')
+    args = parser.parse_args(argv)
+    computerPlayers = [['red', 'white'].index(color) for color in args.computer]
+
+    startState = None
+    if args.position:
+        try:
+            startState, match = gnubgId.decode(args.position)
+        except ValueError as error:
+            parser.error('bad --position: %s' % error)
+
+    replay = None
+    if args.replay:
+        try:
+            replay = gameRecord.GameArchive(args.replay)[args.game]
+        except (IndexError, OSError, ValueError) as error:
+            parser.error('bad --replay: %s' % error)
+        startState = replay.state
+
+    def newDice(game):
+        """Returns the dice source for game number game of the session. A
+        replayed game carries on with seeded rolls once the recorded ones run
+        out."""
+        seed = None if args.seed is None else args.seed + game
+        if replay is None:
+            return diceSource.SeededDice(seed)
+        return diceSource.ReplayDice.fromRecord(replay,
+                                                diceSource.SeededDice(seed))
+
+    # The network needs numpy, so it is only imported when it is used
+    evaluator = None
+    if args.weights:
+        import neuralNet
+        evaluator = neuralNet.NeuralEvaluator.load(args.weights)
+
+    recorder = None
+    if args.record:
+        recorder = gameRecord.GameRecordWriter(args.record)
+
+    # Instrumentation wraps the board's methods while it is enabled, so
+    # without it nothing is measured and nothing is slowed down
+    profiler = None
+    if args.profile or args.profile_dump:
+        import instrumentation
+        profiler = instrumentation.Instrumentation(overlay=args.profile)
+        profiler.enable(Board)
+
+    screen = pygame.display.set_mode((WIN_LENGTH, WIN_HEIGHT))
+    clock = pygame.time.Clock()
+    board = Board(screen, computerPlayers, args.think_time, evaluator, recorder,
+                  startState, newDice(0), args.hints)
+    games = 1
+    running = True
+
+    # Mouse motion is never used, so it should not wake the loop up
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+
+    # Game loop. While a person is to move nothing changes until they do
+    # something, so the loop sleeps until an event arrives. While the computer
+    # plays, it keeps going at no more than args.fps turns a second.
+    while running:
+        player = board.players[board.getCurrentPlayer()]
+        computerTurn = player.isComputer() and not board.isFinished() and \
+            not board.isReviewing()
+        if computerTurn:
+            events = pygame.event.get()
+        else:
+            events = [pygame.event.wait(IDLE_TIMEOUT)]
+
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == hintWorker.HINT_EVENT:
+                board.showHints(event.hints)
+            elif board.isFinished():
+                # The history keys step through the finished game, and any
+                # other key or a click starts a new one
+                if event.type == pygame.MOUSEBUTTONDOWN or \
+                   (event.type == pygame.KEYDOWN and
+                    not stepHistory(board, event.key)):
+                    board = Board(screen, computerPlayers, args.think_time,
+                                  evaluator, recorder, startState,
+                                  newDice(games), board.hints)
+                    games += 1
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                board.checkClick(event.pos)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_i:
+                board.setShowId(not board.showId)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+                board.setHints(not board.hints)
+            elif event.type == pygame.KEYDOWN:
+                stepHistory(board, event.key)
+
+        if computerTurn and running:
+            player.takeTurn()
+            clock.tick(args.fps)
+
+    if recorder is not None:
+        recorder.close()
+    if profiler is not None:
+        profiler.disable()
+        print(profiler.report())
+        if args.profile_dump:
+            profiler.registry.dump(args.profile_dump)
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+from gameState import GameState, BAR, OFF, CHECKERS, RED, WHITE
+
+# Internally positions are seen from the side of the player on roll as a list
+# of 26 ints. Index i holds the checkers i + 1 pips away from being borne off,
+# positive for the player's own checkers and negative for the opponent's.
+# Index 24 is the player's bar and index 25 the opponent's bar. Moving a
+# checker with a die always goes from index i to index i - die, and any target
+# below 0 is a bear-off.
+#
+# These functions handle one position at a time for the board, the agents
+# and the search. A position's plays are found by a depth-first search over
+# the relative lists, deduplicated on their tuples, and each resulting state
+# is derived from the original one by setting only the slots the play
+# changed. This generates the plays of around 8000 positions a second, or
+# some 120000 resulting positions, on one core. batchMoves.batchLegalPlays
+# is faster still for many positions at once.
+REL_BAR = 24
+REL_OPP_BAR = 25
+
+# The 21 distinct rolls with their probabilities
+ROLLS = [((die1, die2), (1 if die1 == die2 else 2) / 36.0)
+         for die1 in range(1, 7) for die2 in range(die1, 7)]
+
+
+def diceNumbers(dice):
+    """Returns the list of numbers that can be played with a roll, with
+    doubles played four times."""
+    die1, die2 = dice
+    if die1 == die2:
+        return [die1] * 4
+    return [die1, die2]
+
+
+def toRelative(state):
+    """Returns the position of state as seen by the player on roll."""
+    board = state.board
+    player = state.currentPlayer
+    if player == RED:
+        pos = [board[23 - i] for i in range(24)]
+    else:
+        pos = [-board[i] for i in range(24)]
+    pos.append(board[BAR + player])
+    pos.append(board[BAR + 1 - player])
+    return pos
+
+
+def fromRelative(pos, state):
+    """Returns a new GameState holding the relative position pos, played by
+    the player on roll in state."""
+    player = state.currentPlayer
+    if player == RED:
+        board = list(pos[23::-1])
+    else:
+        board = [-count for count in pos[:24]]
+    board += state.board[BAR:]
+    board[BAR + player] = pos[REL_BAR]
+    board[BAR + 1 - player] = pos[REL_OPP_BAR]
+    # The sum of the points is the player's checkers on the board less the
+    # opponent's, and the opponent's count is known from their bar and off
+    # slots, which saves looking for the player's checkers one by one
+    opponentOnBoard = CHECKERS - pos[REL_OPP_BAR] - board[OFF + 1 - player]
+    board[OFF + player] = CHECKERS - pos[REL_BAR] - \
+        (sum(pos[:24]) + opponentOnBoard)
+    return GameState(board, player)
+
+
+# Converts relative source and target indices into board points, BAR or OFF
+# for each player. Targets below 0 are bear-offs and wrap round to the OFF
+# entries at the end of the list.
+_ABSOLUTE = (tuple(range(23, -1, -1)) + (BAR,) + (OFF,) * 6,
+             tuple(range(24)) + (BAR,) + (OFF,) * 6)
+
+# Board slot of each relative index for each player and the sign its count
+# is stored with there
+_SLOT = (tuple(range(23, -1, -1)) + (BAR + RED, BAR + WHITE),
+         tuple(range(24)) + (BAR + WHITE, BAR + RED))
+_SIGN = ((1,) * 24 + (1, 1), (-1,) * 24 + (1, 1))
+
+
+def _singleMoves(pos, die, maxSource=23):
+    """Returns the (source, target) pairs of relative indices a single
+    checker can be moved with die, taking checkers from no higher than
+    maxSource."""
+    if pos[REL_BAR] > 0:
+        target = REL_BAR - die
+        if pos[target] >= -1:
+            return [(REL_BAR, target)]
+        return []
+
+    if max(pos[6:24]) > 0:
+        # Not all checkers are home, so nothing can be borne off
+        return [(source, source - die)
+                for source in range(min(maxSource, 23), die - 1, -1)
+                if pos[source] > 0 and pos[source - die] >= -1]
+
+    moves = []
+
+    # All checkers are home. A die larger than needed may only bear off from
+    # the highest occupied point
+    top = -1
+    for i in range(5, -1, -1):
+        if pos[i] > 0:
+            top = i
+            break
+    for source in range(min(maxSource, top), -1, -1):
+        if pos[source] <= 0:
+            continue
+        target = source - die
+        if target >= 0:
+            if pos[target] >= -1:
+                moves.append((source, target))
+        elif target == -1 or source == top:
+            moves.append((source, target))
+    return moves
+
+
+def _play(pos, source, target):
+    """Returns a copy of pos after moving one checker from source to
+    target."""
+    child = pos[:]
+    child[source] -= 1
+    if target >= 0:
+        if child[target] == -1:
+            child[target] = 0
+            child[REL_OPP_BAR] += 1
+        child[target] += 1
+    return child
+
+
+def _search(pos, numbers, depth, moves, maxSource, leaves):
+    """Plays numbers[depth:] from pos in order, recording every reachable
+    final position in leaves as key -> (moves, dice used, first die). When
+    all numbers are equal, sources are kept non-increasing so the same set
+    of moves is only tried in one order. The positions after the last number
+    are recorded here rather than in a call of their own, since they are
+    most of the positions searched."""
+    last = depth + 1 == len(numbers)
+    doubles = numbers[0] == numbers[-1]
+    found = False
+    for source, target in _singleMoves(pos, numbers[depth], maxSource):
+        found = True
+        child = _play(pos, source, target)
+        if last:
+            key = tuple(child)
+            if key not in leaves:
+                leaves[key] = (moves + ((source, target),), depth + 1,
+                               numbers[0])
+        else:
+            _search(child, numbers, depth + 1, moves + ((source, target),),
+                    source if doubles else REL_BAR, leaves)
+    if not found:
+        key = tuple(pos)
+        if key not in leaves:
+            leaves[key] = (moves, depth, numbers[0] if depth else 0)
+
+
+def _searchLeaves(pos, numbers):
+    """Returns the leaves of a search of numbers in every distinct order."""
+    if not numbers:
+        return {tuple(pos): ((), 0, 0)}
+    leaves = {}
+    _search(pos, numbers, 0, (), REL_BAR, leaves)
+    if len(numbers) == 2 and numbers[0] != numbers[1]:
+        _search(pos, numbers[::-1], 0, (), REL_BAR, leaves)
+    return leaves
+
+
+def _relativePlays(pos, numbers):
+    """Returns the legal plays for the relative position pos and the die
+    numbers as a dict of resulting position key -> relative moves."""
+    leaves = _searchLeaves(pos, numbers)
+
+    # The player has to use as many dice as possible
+    mostUsed = 0
+    for moves, used, firstDie in leaves.values():
+        if used > mostUsed:
+            mostUsed = used
+
+    # If only one of two different dice can be played, it has to be the
+    # larger one if that is possible
+    largest = 0
+    if mostUsed == 1 and len(numbers) == 2 and numbers[0] != numbers[1]:
+        for moves, used, firstDie in leaves.values():
+            if firstDie > largest:
+                largest = firstDie
+
+    plays = {}
+    for key, (moves, used, firstDie) in leaves.items():
+        if used == mostUsed and (not largest or firstDie == largest):
+            plays[key] = moves
+    return plays
+
+
+def legalPlaysForNumbers(state, numbers):
+    """Returns every legal play of the die numbers for the player on roll in
+    state as a list of (play, resulting state) pairs, where a play is a tuple
+    of (start, end) moves as accepted by GameState.moveChecker. Plays leading
+    to the same position are only listed once. If nothing can be moved a
+    single empty play is returned."""
+    player = state.currentPlayer
+    absolute = _ABSOLUTE[player]
+    slots = _SLOT[player]
+    signs = _SIGN[player]
+    off = OFF + player
+    offCount = state.board[off]
+    pos = toRelative(state)
+    oppBar = pos[REL_OPP_BAR]
+    oppBarSlot = BAR + 1 - player
+    result = []
+    for key, moves in _relativePlays(pos, list(numbers)).items():
+        # Only the slots the play touches change, so the resulting state is
+        # derived from these rather than built and hashed from scratch. A
+        # slot touched twice is simply set to the same count again.
+        play = []
+        changes = []
+        borneOff = 0
+        for source, target in moves:
+            play.append((absolute[source], absolute[target]))
+            changes.append((slots[source], key[source] * signs[source]))
+            if target >= 0:
+                changes.append((slots[target], key[target] * signs[target]))
+            else:
+                borneOff += 1
+        if borneOff:
+            changes.append((off, offCount + borneOff))
+        if key[REL_OPP_BAR] != oppBar:
+            changes.append((oppBarSlot, key[REL_OPP_BAR]))
+        result.append((tuple(play), state._derive(changes)))
+    return result
+
+
+def legalPlays(state, dice):
+    """Returns every legal play of the roll dice for the player on roll in
+    state. See legalPlaysForNumbers."""
+    return legalPlaysForNumbers(state, diceNumbers(dice))
+
+
+def legalPlayMovesForNumbers(state, numbers):
+    """Returns the plays of legalPlaysForNumbers, in the same order, without
+    their resulting states, for callers that only need the moves."""
+    absolute = _ABSOLUTE[state.currentPlayer]
+    return [tuple([(absolute[source], absolute[target])
+                   for source, target in moves])
+            for moves in _relativePlays(toRelative(state),
+                                        list(numbers)).values()]
+
+
+def _mostPlayable(pos, numbers):
+    """Returns the largest number of numbers that can be played from pos."""
+    if not numbers:
+        return 0
+    mostUsed = 0
+    for moves, used, firstDie in _searchLeaves(pos, numbers).values():
+        if used > mostUsed:
+            mostUsed = used
+    return mostUsed
+
+
+def legalFirstMoves(state, numbers):
+    """Returns the single checker moves the player on roll may start with,
+    given the die numbers left to play, as a list of (start, end, die)
+    triples. Used by the GUI, which moves one checker at a time."""
+    player = state.currentPlayer
+    pos = toRelative(state)
+    numbers = list(numbers)
+    mostUsed = _mostPlayable(pos, numbers)
+    if not mostUsed:
+        return []
+
+    candidates = []
+    for die in sorted(set(numbers), reverse=True):
+        rest = numbers[:]
+        rest.remove(die)
+        for source, target in _singleMoves(pos, die):
+            if 1 + _mostPlayable(_play(pos, source, target), rest) == mostUsed:
+                candidates.append((source, target, die))
+
+    # Only the larger die may be played when just one die can be used
+    if mostUsed == 1 and candidates:
+        largest = candidates[0][2]
+        candidates = [move for move in candidates if move[2] == largest]
+
+    absolute = _ABSOLUTE[player]
+    return [(absolute[source], absolute[target], die)
+            for source, target, die in candidates]
@@ -0,0 +1,230 @@
+import argparse
+import random
+
+import numpy
+
+import evaluation
+import gameState
+import moveGeneration
+from gameState import BAR, OFF, RED, WHITE, CHECKERS, SIZE
+
+# TD-Gammon style evaluator. Positions use the standard 198 unit encoding:
+# for each player and point, four units for having at least one, two and
+# three checkers there and (n - 3) / 2 for any more, then both bar counts
+# halved, both borne-off counts over 15 and two units for whose turn it is.
+# A small network with one sigmoid hidden layer turns that into the
+# probability that red wins.
+INPUTS = 198
+DEFAULT_PATH = 'td-weights.npz'
+
+
+def _sigmoid(x):
+    """Returns the logistic function of x."""
+    return 1.0 / (1.0 + numpy.exp(-x))
+
+
+def boardArray(states):
+    """Returns the boards of a list of GameStates as an N x 28 int8 array."""
+    data = b''.join([state.board.tobytes() for state in states])
+    return numpy.frombuffer(data, dtype=numpy.int8).reshape(len(states),
+                                                             SIZE)
+
+
+def encode(boards, players):
+    """Returns the N x 198 input encoding of an N x 28 array of boards with
+    players the player on roll in each row."""
+    boards = numpy.asarray(boards, dtype=numpy.float32)
+    count = len(boards)
+    points = boards[:, :24]
+    features = numpy.empty((count, INPUTS), dtype=numpy.float32)
+    for offset, checkers in ((0, numpy.maximum(points, 0)),
+                             (96, numpy.maximum(-points, 0))):
+        units = features[:, offset:offset + 96].reshape(count, 24, 4)
+        units[:, :, 0] = checkers >= 1
+        units[:, :, 1] = checkers >= 2
+        units[:, :, 2] = checkers >= 3
+        units[:, :, 3] = numpy.maximum(checkers - 3, 0) / 2.0
+    features[:, 192:194] = boards[:, BAR:BAR + 2] / 2.0
+    features[:, 194:196] = boards[:, OFF:OFF + 2] / float(CHECKERS)
+    players = numpy.asarray(players)
+    features[:, 196] = players == RED
+    features[:, 197] = players == WHITE
+    return features
+
+
+class Network:
+    """Multilayer perceptron with one sigmoid hidden layer and a single
+    sigmoid output, evaluated on whole batches of inputs at once."""
+
+    def __init__(self, hidden=40, seed=0):
+        rng = numpy.random.default_rng(seed)
+        self.hidden1 = rng.uniform(-0.1, 0.1, (INPUTS, hidden))
+        self.bias1 = numpy.zeros(hidden)
+        self.hidden2 = rng.uniform(-0.1, 0.1, hidden)
+        self.bias2 = 0.0
+
+    def forward(self, features):
+        """Returns the outputs for an N x 198 array of inputs."""
+        hidden = _sigmoid(features @ self.hidden1 + self.bias1)
+        return _sigmoid(hidden @ self.hidden2 + self.bias2)
+
+    def gradient(self, features):
+        """Returns the output for one input vector and the gradient of the
+        output with respect to each parameter."""
+        hidden = _sigmoid(features @ self.hidden1 + self.bias1)
+        output = _sigmoid(hidden @ self.hidden2 + self.bias2)
+        delta2 = output * (1.0 - output)
+        delta1 = delta2 * self.hidden2 * hidden * (1.0 - hidden)
+        return output, (numpy.outer(features, delta1), delta1,
+                        delta2 * hidden, delta2)
+
+    def parameters(self):
+        """Returns the parameters in the order gradient uses."""
+        return [self.hidden1, self.bias1, self.hidden2, self.bias2]
+
+    def update(self, steps):
+        """Adds steps, ordered like parameters, to the parameters."""
+        self.hidden1 += steps[0]
+        self.bias1 += steps[1]
+        self.hidden2 += steps[2]
+        self.bias2 += steps[3]
+
+    def save(self, path=DEFAULT_PATH):
+        """Writes the weights to path as a NumPy .npz archive."""
+        numpy.savez(path, hidden1=self.hidden1, bias1=self.bias1,
+                    hidden2=self.hidden2, bias2=self.bias2)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        """Returns a Network with the weights saved at path."""
+        with numpy.load(path) as weights:
+            network = cls(hidden=len(weights['bias1']))
+            network.hidden1 = weights['hidden1']
+            network.bias1 = weights['bias1']
+            network.hidden2 = weights['hidden2']
+            network.bias2 = float(weights['bias2'])
+        return network
+
+
+def redWinProbabilities(network, states):
+    """Returns the network's probability that red wins each of a list of
+    GameStates, with finished games given their exact outcome."""
+    players = [state.currentPlayer for state in states]
+    boards = boardArray(states)
+    redWins = network.forward(encode(boards, players))
+    redWins[boards[:, OFF + RED] == CHECKERS] = 1.0
+    redWins[boards[:, OFF + WHITE] == CHECKERS] = 0.0
+    return redWins
+
+
+class NeuralEvaluator(evaluation.Evaluator):
+    """Evaluator backed by a Network. evaluateMany encodes and scores all its
+    positions with one pass through the network."""
+
+    def __init__(self, network=None):
+        if network is None:
+            network = Network()
+        self.network = network
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        """Returns an evaluator using the weights saved at path."""
+        return cls(Network.load(path))
+
+    def evaluate(self, state):
+        return self.evaluateMany([state])[0]
+
+    def evaluateMany(self, states):
+        if not states:
+            return []
+        redWins = redWinProbabilities(self.network, states)
+        players = numpy.array([state.currentPlayer for state in states])
+        equities = numpy.where(players == RED, 2.0 * redWins - 1.0,
+                               1.0 - 2.0 * redWins)
+        return equities.tolist()
+
+
+def trainGame(network, rng, alpha=0.1, lam=0.7):
+    """Plays one game of self-play where both sides pick the play the network
+    rates best, updating the network after every turn with TD(lambda).
+    Returns the index of the winner."""
+    state = gameState.GameState(currentPlayer=rng.randrange(2))
+    traces = [numpy.zeros_like(parameter, dtype=float)
+              for parameter in network.parameters()]
+
+    def features(position):
+        return encode(boardArray([position]), [position.currentPlayer])[0]
+
+    value, gradient = network.gradient(features(state))
+    while True:
+        dice = (rng.randrange(1, 7), rng.randrange(1, 7))
+        player = state.currentPlayer
+        results = []
+        for play, result in moveGeneration.legalPlays(state, dice):
+            result.changeTurn()
+            results.append(result)
+        redWins = redWinProbabilities(network, results)
+        if player == RED:
+            state = results[numpy.argmax(redWins)]
+        else:
+            state = results[numpy.argmin(redWins)]
+
+        # Moves the estimate for the previous positions, weighted by the
+        # decaying traces of their gradients, towards the new estimate or,
+        # once the game is over, its result
+        traces = [lam * trace + grad for trace, grad in zip(traces, gradient)]
+        winner = state.winner()
+        if winner is not None:
+            error = alpha * ((1.0 if winner == RED else 0.0) - value)
+            network.update([error * trace for trace in traces])
+            return winner
+        nextValue, nextGradient = network.gradient(features(state))
+        error = alpha * (nextValue - value)
+        network.update([error * trace for trace in traces])
+        value, gradient = nextValue, nextGradient
+
+
+def train(network, games, alpha=0.1, lam=0.7, seed=0, progress=None):
+    """Trains network by TD(lambda) self-play for a number of games.
+    progress, if given, is called with the number of games played and the
+    number of red wins every 100 games."""
+    rng = random.Random(seed)
+    redWins = 0
+    for game in range(1, games + 1):
+        if trainGame(network, rng, alpha, lam) == RED:
+            redWins += 1
+        if progress is not None and not game % 100:
+            progress(game, redWins)
+    return network
+
+
+def main(argv=None):
+    """Trains a network from the command line and saves its weights."""
+    parser = argparse.ArgumentParser(description='Train the TD-Gammon style '
+                                     'evaluator by self-play.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--hidden', type=int, default=40)
+    parser.add_argument('--alpha', type=float, default=0.1)
+    parser.add_argument('--lam', type=float, default=0.7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--resume', action='store_true',
+                        help='continue training the weights at --out')
+    parser.add_argument('--out', default=DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        network = Network.load(args.out)
+    else:
+        network = Network(args.hidden, args.seed)
+
+    def progress(games, redWins):
+        print('%d games, red won %d' % (games, redWins))
+        network.save(args.out)
+
+    train(network, args.games, args.alpha, args.lam, args.seed, progress)
+    network.save(args.out)
+    print('Saved weights to %s' % args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import collections
+import struct
+
+import gameState
+
+# History of the positions of a game, for undo, redo and jumping to any ply.
+# Every ply is one fixed-size record in a single bytearray: the position's
+# board array, the player on roll, the dice, the numbers still to be played
+# and a mark of the game record's length at that point. Jumping to a ply only
+# decodes its record, and a 200-ply game takes 8 kilobytes.
+
+# board, player, die1, die2, rolled, up to four numbers left (0 for none) and
+# the recorder mark
+_RECORD = struct.Struct('<%dsBBBB4BI' % gameState.SIZE)
+
+# A decoded ply. dice is the (die1, die2) faces, numbers the dice numbers left
+# to play and rolled whether the player on roll has rolled them.
+Snapshot = collections.namedtuple('Snapshot', 'state dice numbers rolled mark')
+
+
+class PositionHistory:
+    """Plies of one game, with a current ply that undo and redo move.
+    Pushing a ply after stepping back discards the plies that came after
+    the current one."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.position = -1
+
+    def __len__(self):
+        return len(self.data) // _RECORD.size
+
+    def clear(self):
+        """Forgets every ply."""
+        self.data = bytearray()
+        self.position = -1
+
+    def truncate(self):
+        """Forgets the plies after the current one."""
+        del self.data[(self.position + 1) * _RECORD.size:]
+
+    def push(self, state, dice, numbers, rolled, mark=0):
+        """Adds a ply after the current one and makes it current."""
+        numbers = list(numbers) + [0] * (4 - len(numbers))
+        self.truncate()
+        self.data += _RECORD.pack(state.board.tobytes(), state.currentPlayer,
+                                  dice[0], dice[1], rolled, *numbers, mark)
+        self.position += 1
+
+    def snapshot(self, ply):
+        """Returns the Snapshot of ply, counting from 0."""
+        if not 0 <= ply < len(self):
+            raise IndexError('ply %d is not in a history of %d'
+                             % (ply, len(self)))
+        fields = _RECORD.unpack_from(self.data, ply * _RECORD.size)
+        board, player, die1, die2, rolled = fields[:5]
+        # The board array is built straight from its bytes
+        return Snapshot(gameState.GameState(board, player), (die1, die2),
+                        [n for n in fields[5:9] if n], bool(rolled), fields[9])
+
+    def isLatest(self):
+        """Returns True if the current ply is the last one."""
+        return self.position == len(self) - 1
@@ -0,0 +1,299 @@
+import argparse
+import collections
+import math
+import multiprocessing
+import random
+
+import evaluation
+import gameState
+import moveGeneration
+import transpositionCache
+from evaluation import WIN
+
+# Monte-Carlo rollouts. A position is played out many times by a 1-ply player
+# using an evaluator, and the average result estimates its equity for the
+# player on roll. Results are cubeless and gammons are not counted, like the
+# evaluators.
+#
+# Two things cut the number of games needed:
+#
+# - Quasi-random dice. Over every 36 games the first roll takes each of the
+#   36 values once, over every 1296 games each pair of first and second rolls
+#   comes up once, and so on for as many turns as the number of games covers.
+#   Later rolls are random. When several plays are rolled out, every play sees
+#   the same dice, so the differences between them are measured more exactly
+#   than the equities themselves.
+#
+# - Luck adjustment. Before every roll the evaluator's value of the position
+#   is the average over the 21 rolls of the best play's value. The difference
+#   between that and the value with the roll that came up is the luck of the
+#   roll. The total luck of a game has an expected value of zero, so it is
+#   used as a control variate: the results are corrected by the luck times
+#   the coefficient that best explains them by it, measured over the
+#   rollout. A well calibrated evaluator gives a coefficient near one and
+#   removes most of the variance, and a poor one can only do less good, not
+#   harm.
+
+# Equity estimate of a rollout. low and high bound the confidence interval
+# and games is the number of games it is based on.
+RolloutResult = collections.namedtuple('RolloutResult',
+                                       'equity standardError low high games')
+
+# Every ordered roll, so stratifying over 36 values gives each one equal
+# weight
+_ORDERED_ROLLS = [(die1, die2) for die1 in range(1, 7)
+                  for die2 in range(1, 7)]
+_ROLL_INDEX = dict((dice, i) for i, (dice, probability)
+                   in enumerate(moveGeneration.ROLLS))
+
+
+class QuasiRandomDice:
+    """Dice sequences for a batch of games, stratified over the first turns
+    of the batch. Each turn's rolls are shuffled by a permutation drawn from
+    seed, and game i's later rolls come from a generator seeded with
+    seed + i, so any one game can be replayed on its own."""
+
+    def __init__(self, games, seed=0):
+        # Stratifies turn t if the batch has more than 36 ** t games
+        turns = 0
+        while 36 ** turns < games:
+            turns += 1
+        rng = random.Random(seed)
+        self.seed = seed
+        self.permutations = []
+        for turn in range(turns):
+            permutation = list(_ORDERED_ROLLS)
+            rng.shuffle(permutation)
+            self.permutations.append(permutation)
+
+    def rolls(self, game):
+        """Yields the rolls of game number game without end."""
+        # Turn t uses the sum of the first t + 1 base-36 digits of game, which
+        # covers every combination of the stratified turns once per block of
+        # games and also balances each turn within every 36 games
+        index = 0
+        for turn, permutation in enumerate(self.permutations):
+            index += game // 36 ** turn
+            yield permutation[index % 36]
+        rng = random.Random(self.seed + game)
+        while True:
+            yield (rng.randrange(1, 7), rng.randrange(1, 7))
+
+
+class RolloutPlayer:
+    """Plays out games with the evaluator's best 1-ply play and measures the
+    luck of every roll. The best play of each roll from a position is cached,
+    which saves most of the work near the starting position shared by every
+    game of a rollout."""
+
+    def __init__(self, evaluator=None, cacheSize=1 << 14):
+        if evaluator is None:
+            evaluator = evaluation.HeuristicEvaluator()
+        self.evaluator = evaluator
+        self.cache = transpositionCache.LRUCache(cacheSize)
+
+    def bestPlay(self, state, dice):
+        """Returns (value, resulting state) for the best play of dice, with
+        value the equity for the player who made it and the turn passed to
+        the opponent unless the play won."""
+        key = (state.zobrist, _ROLL_INDEX[tuple(sorted(dice))])
+        cached = self.cache.lookup(key)
+        if cached is not None:
+            return cached
+        player = state.currentPlayer
+        best = None
+        waiting = []
+        for play, result in moveGeneration.legalPlays(state, dice):
+            if result.isWon(player):
+                best = (WIN, result)
+                break
+            result.changeTurn()
+            waiting.append(result)
+        if best is None:
+            values = self.evaluator.evaluateMany(waiting)
+            index = min(range(len(values)), key=values.__getitem__)
+            best = (-values[index], waiting[index])
+        self.cache.store(key, best)
+        return best
+
+    def luck(self, state, dice):
+        """Returns (luck, resulting state) for the player on roll in state
+        rolling dice and making the best play."""
+        expected = 0.0
+        for roll, probability in moveGeneration.ROLLS:
+            expected += probability * self.bestPlay(state, roll)[0]
+        value, result = self.bestPlay(state, dice)
+        return value - expected, result
+
+    def playGame(self, state, rolls, truncate=None, varianceReduction=True):
+        """Plays state out with the dice from the iterator rolls and returns
+        the result and the total luck, both for the player on roll in state.
+        With truncate, the game is scored by the evaluator after that many
+        turns instead. Without varianceReduction the luck is not measured
+        and is returned as 0."""
+        player = state.currentPlayer
+        totalLuck = 0.0
+        turns = 0
+        while True:
+            value = evaluation.terminalValue(state)
+            if value is not None:
+                break
+            if truncate is not None and turns >= truncate:
+                value = self.evaluator.evaluate(state)
+                break
+            dice = next(rolls)
+            if varianceReduction:
+                luck, result = self.luck(state, dice)
+                if state.currentPlayer == player:
+                    totalLuck += luck
+                else:
+                    totalLuck -= luck
+            else:
+                result = self.bestPlay(state, dice)[1]
+            # Cached results are shared, so the game continues on a copy
+            state = result.copy()
+            turns += 1
+        if state.currentPlayer != player:
+            value = -value
+        return value, totalLuck
+
+
+def _rolloutChunk(job):
+    """Worker entry point. Plays a list of numbered games from one position
+    and returns the position's index with their results."""
+    index, state, games, numbers, settings = job
+    evaluator, seed, truncate, varianceReduction = settings
+    player = RolloutPlayer(evaluator)
+    dice = QuasiRandomDice(games, seed)
+    return index, [player.playGame(state, dice.rolls(number), truncate,
+                                   varianceReduction)
+                   for number in numbers]
+
+
+def _mean(values):
+    """Returns the mean of a list of numbers."""
+    return sum(values) / len(values)
+
+
+def _covariance(xs, ys):
+    """Returns the sample covariance of two lists of numbers."""
+    if len(xs) < 2:
+        return 0.0
+    meanX = _mean(xs)
+    meanY = _mean(ys)
+    return sum((x - meanX) * (y - meanY)
+               for x, y in zip(xs, ys)) / (len(xs) - 1)
+
+
+def summarise(games, z=1.96):
+    """Returns the RolloutResult for a list of (result, luck) pairs from
+    RolloutPlayer.playGame, with a confidence interval of z standard errors
+    either side."""
+    results = [result for result, luck in games]
+    lucks = [luck for result, luck in games]
+    spread = _covariance(lucks, lucks)
+    if spread > 0.0:
+        coefficient = _covariance(results, lucks) / spread
+        results = [result - coefficient * luck for result, luck in games]
+    mean = _mean(results)
+    error = math.sqrt(_covariance(results, results) / len(results))
+    return RolloutResult(mean, error, mean - z * error, mean + z * error,
+                         len(results))
+
+
+def rolloutMany(states, games=1296, evaluator=None, processes=None, seed=0,
+                truncate=None, varianceReduction=True, chunkSize=36, z=1.96):
+    """Rolls out each of a list of GameStates for the player on roll and
+    returns their RolloutResults. Every position is played with the same
+    dice sequences, and the games are spread across a pool of processes.
+    With processes=1 the games are played in this process."""
+    settings = (evaluator, seed, truncate, varianceReduction)
+    jobs = []
+    for index, state in enumerate(states):
+        for start in range(0, games, chunkSize):
+            numbers = range(start, min(start + chunkSize, games))
+            jobs.append((index, state, games, numbers, settings))
+
+    outcomes = [[] for state in states]
+    if processes == 1:
+        for index, chunk in map(_rolloutChunk, jobs):
+            outcomes[index].extend(chunk)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            for index, chunk in pool.imap_unordered(_rolloutChunk, jobs):
+                outcomes[index].extend(chunk)
+    return [summarise(chunk, z) for chunk in outcomes]
+
+
+def rollout(state, games=1296, **options):
+    """Returns the RolloutResult of state for the player on roll. Takes the
+    same options as rolloutMany."""
+    return rolloutMany([state], games, **options)[0]
+
+
+def rolloutPlays(state, dice, plays=None, games=1296, **options):
+    """Rolls out candidate plays of dice for the player on roll in state and
+    returns (play, RolloutResult) pairs, best first. plays defaults to every
+    legal play. Takes the same options as rolloutMany."""
+    if plays is None:
+        plays = [play for play, result in moveGeneration.legalPlays(state,
+                                                                    dice)]
+    player = state.currentPlayer
+    children = []
+    for play in plays:
+        child = state.copy()
+        child.applyPlay(play)
+        if not child.isWon(player):
+            child.changeTurn()
+        children.append(child)
+
+    results = []
+    for play, child, result in zip(plays, children,
+                                   rolloutMany(children, games, **options)):
+        if child.currentPlayer != player:
+            equity = -result.equity
+            result = result._replace(equity=equity, low=-result.high,
+                                     high=-result.low)
+        results.append((play, result))
+    results.sort(key=lambda item: item[1].equity, reverse=True)
+    return results
+
+
+def formatResult(result):
+    """Returns a one-line description of a RolloutResult."""
+    return '%+.4f +/- %.4f [%+.4f, %+.4f] over %d games' % (
+        result.equity, result.standardError, result.low, result.high,
+        result.games)
+
+
+def main(argv=None):
+    """Rolls out the starting position, or the plays of a first roll, from
+    the command line."""
+    parser = argparse.ArgumentParser(description='Monte-Carlo rollouts of '
+                                     'backgammon positions.')
+    parser.add_argument('--games', type=int, default=1296)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--truncate', type=int, default=None,
+                        help='score games with the evaluator after N turns')
+    parser.add_argument('--no-variance-reduction', action='store_true')
+    parser.add_argument('--dice', type=int, nargs=2, default=None,
+                        help='roll out every play of this opening roll')
+    args = parser.parse_args(argv)
+
+    options = dict(processes=args.processes, seed=args.seed,
+                   truncate=args.truncate,
+                   varianceReduction=not args.no_variance_reduction)
+    state = gameState.GameState()
+    if args.dice is None:
+        print(formatResult(rollout(state, args.games, **options)))
+        return
+    for play, result in rolloutPlays(state, tuple(args.dice),
+                                     games=args.games, **options):
+        moves = ' '.join('%s/%s' % move for move in play)
+        print('%-24s %s' % (moves, formatResult(result)))
+
+
+if __name__ == '__main__':
+    main()
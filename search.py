@@ -0,0 +1,195 @@
+import time
+
+import evaluation
+import moveGeneration
+import simulation
+import transpositionCache
+from evaluation import LOSS, WIN
+
+# Expectiminimax search over the 21 distinct rolls. Values are always from
+# the side of the player to act at a node, so a parent negates its children.
+#
+# Depth counts the plays looked at: depth 1 scores each play with the
+# evaluator, depth 2 also averages over every opponent roll and their best
+# reply, and so on.
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its time budget runs out."""
+    pass
+
+
+class ExpectiminimaxSearch:
+    """Chooses plays with an n-ply expectiminimax search. Chance nodes are
+    pruned with Star1 bounds, tightened Star2-style by first searching the
+    best-ordered play of every roll. Plays are ordered by their static
+    evaluation, and with a time budget the search deepens iteratively and
+    returns the result of the deepest iteration that finished."""
+
+    def __init__(self, evaluator=None, maxDepth=3, timeBudget=None,
+                 cache=None):
+        if evaluator is None:
+            evaluator = evaluation.HeuristicEvaluator()
+        if cache is None:
+            cache = transpositionCache.LRUCache(1 << 16)
+        self.evaluator = evaluator
+        self.maxDepth = maxDepth
+        self.timeBudget = timeBudget
+        self.cache = cache
+        self.deadline = None
+        self.nodes = 0
+        self.completedDepth = 0
+
+    def choosePlay(self, state, dice):
+        """Returns the (play, resulting state) pair of legalPlays that the
+        search rates best for the player on roll in state."""
+        if self.timeBudget is None:
+            self.deadline = None
+        else:
+            self.deadline = time.perf_counter() + self.timeBudget
+        self.nodes = 0
+
+        # Depth 1 always finishes so there is a play to return
+        children = self._orderedChildren(state,
+                                         moveGeneration.diceNumbers(dice))
+        self.completedDepth = 1
+        if len(children) == 1 or children[0][0] == WIN:
+            return children[0][1], children[0][2]
+
+        for depth in range(2, self.maxDepth + 1):
+            try:
+                children = self._searchRoot(children, depth)
+            except SearchTimeout:
+                break
+            self.completedDepth = depth
+        return children[0][1], children[0][2]
+
+    def _searchRoot(self, children, depth):
+        """Searches every root play to depth and returns the children sorted
+        best first, which also orders the next iteration."""
+        best = LOSS
+        scored = []
+        for score, play, child, terminal in children:
+            if terminal:
+                value = score
+            else:
+                value = -self._chance(child, depth - 1, -WIN, -best)
+            if value > best:
+                best = value
+            scored.append((value, play, child, terminal))
+        # Values at or below best that were cut off are only upper bounds, but
+        # they can never beat the play that set best
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+    def _checkTime(self):
+        """Raises SearchTimeout if the budget is used up."""
+        self.nodes += 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    def _orderedChildren(self, state, numbers):
+        """Returns (value, play, child, terminal) for each legal play of the
+        die numbers, best first by static evaluation. child has the turn
+        passed to the opponent and value is for the player who made the
+        play."""
+        player = state.currentPlayer
+        children = []
+        waiting = []
+        for play, result in moveGeneration.legalPlaysForNumbers(state,
+                                                                numbers):
+            if result.isWon(player):
+                children.append((WIN, play, result, True))
+            else:
+                result.changeTurn()
+                waiting.append((play, result))
+        values = self.evaluator.evaluateMany([child for play, child
+                                              in waiting])
+        for (play, child), value in zip(waiting, values):
+            children.append((-value, play, child, False))
+        children.sort(key=lambda item: item[0], reverse=True)
+        return children
+
+    def _max(self, children, depth, alpha, beta, best):
+        """Returns the value of the best of children, searched to depth, for
+        the player choosing between them. best is a value already known to
+        be reachable. Stops as soon as a value reaches beta."""
+        for score, play, child, terminal in children:
+            if best >= beta:
+                break
+            if terminal:
+                value = score
+            elif depth == 1:
+                value = score
+            else:
+                value = -self._chance(child, depth - 1, -beta,
+                                      -max(alpha, best))
+            if value > best:
+                best = value
+        return best
+
+    def _chance(self, state, depth, alpha, beta):
+        """Returns the expected value of state for the player about to roll,
+        searching each roll to depth. If the value is at most alpha or at
+        least beta, a bound on that side may be returned instead."""
+        self._checkTime()
+        cached = self.cache.lookup(state.zobrist, depth)
+        if cached is not None:
+            return cached
+        if depth == 0:
+            value = self.evaluator.evaluate(state)
+            self.cache.store(state.zobrist, value, depth)
+            return value
+
+        # Star2 probing: a roll is worth at least its best-ordered play, so
+        # searching those first gives a lower bound for every roll
+        nodes = []
+        for dice, probability in moveGeneration.ROLLS:
+            children = self._orderedChildren(
+                state, moveGeneration.diceNumbers(dice))
+            score, play, child, terminal = children[0]
+            if terminal or depth == 1:
+                lower = score
+            else:
+                lower = -self._chance(child, depth - 1, -WIN, -LOSS)
+            nodes.append((probability, children, lower))
+
+        lowerTotal = sum(probability * lower
+                         for probability, children, lower in nodes)
+        if lowerTotal >= beta:
+            return lowerTotal
+
+        # Star1: with the rolls before i searched, the rest bounded below by
+        # their probes and above by WIN, each roll gets a window outside of
+        # which the whole node is known to fail
+        done = 0.0
+        lowerRest = lowerTotal
+        upperRest = 1.0 * WIN
+        for probability, children, lower in nodes:
+            lowerRest -= probability * lower
+            upperRest -= probability * WIN
+            childAlpha = (alpha - done - upperRest) / probability
+            childBeta = (beta - done - lowerRest) / probability
+            value = self._max(children[1:], depth, max(childAlpha, LOSS),
+                              min(childBeta, WIN), lower)
+            done += probability * value
+            if value <= childAlpha:
+                return done + upperRest
+            if value >= childBeta:
+                return done + lowerRest
+
+        self.cache.store(state.zobrist, done, depth)
+        return done
+
+
+class SearchAgent(simulation.Agent):
+    """Agent that picks plays with an ExpectiminimaxSearch, which generates
+    the plays it needs itself."""
+
+    needsResults = False
+
+    def __init__(self, maxDepth=2, timeBudget=None, evaluator=None):
+        self.search = ExpectiminimaxSearch(evaluator, maxDepth, timeBudget)
+
+    def choosePlay(self, state, dice, plays):
+        return self.search.choosePlay(state, dice)
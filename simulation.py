@@ -0,0 +1,260 @@
+import argparse
+import collections
+import multiprocessing
+import random
+import time
+
+import diceSource
+import gameRecord
+import gameState
+import moveGeneration
+
+# Outcome of one simulated game. moves counts single checker moves and turns
+# counts rolls, including those where nothing could be moved. record holds the
+# game's gameRecord bytes when it was recorded.
+GameResult = collections.namedtuple('GameResult',
+                                    'seed winner turns moves record',
+                                    defaults=(None,))
+
+
+class Agent:
+    """Base class for players that choose their plays without a GUI. Agents
+    are pickled to the worker processes, so they should only hold plain
+    data. Agents that never look at the resulting states set needsResults
+    to False and are handed (play, None) pairs, which saves building a
+    state for every legal play."""
+
+    needsResults = True
+
+    def seed(self, seed):
+        """Reseeds any randomness the agent uses. Called before each game."""
+        pass
+
+    def choosePlay(self, state, dice, plays):
+        """Returns one of the (play, resulting state) pairs in plays, which
+        are all the legal plays of dice for the player on roll in state."""
+        raise NotImplementedError
+
+
+class RandomAgent(Agent):
+    """Agent that picks a legal play uniformly at random."""
+
+    needsResults = False
+
+    def __init__(self):
+        self.random = random.Random()
+
+    def seed(self, seed):
+        self.random.seed(seed)
+
+    def choosePlay(self, state, dice, plays):
+        return self.random.choice(plays)
+
+
+class GreedyAgent(Agent):
+    """Agent that picks the play leaving it furthest ahead in the race,
+    preferring plays that leave fewer blots when the race is equal."""
+
+    def choosePlay(self, state, dice, plays):
+        player = state.currentPlayer
+        opponent = 1 - player
+        best = None
+        bestScore = None
+        for play, result in plays:
+            score = (result.pipCount(opponent) - result.pipCount(player),
+                     -gameState.bitCount(result.blotMask(player)))
+            if bestScore is None or score > bestScore:
+                best = (play, result)
+                bestScore = score
+        return best
+
+
+def playGame(agents, seed, firstPlayer=None, recorder=None, dice=None):
+    """Plays one game between agents, a pair of Agent objects for red and
+    white, seeded with seed. Returns a GameResult. firstPlayer is the player
+    on roll at the start; by default it alternates with the seed, red for
+    even seeds and white for odd ones, so neither agent gets the first roll
+    more often over a batch. The rolls come from the diceSource dice, by
+    default SeededDice derived from seed. If a gameRecord.GameEncoder is
+    given as recorder, every roll and move is recorded with it and the
+    result holds the game's bytes."""
+    rng = random.Random(seed)
+    for agent in agents:
+        agent.seed(rng.getrandbits(32))
+    if dice is None:
+        dice = diceSource.SeededDice(rng.getrandbits(64))
+    roll = dice.roll
+    if firstPlayer is None:
+        firstPlayer = seed % 2
+
+    state = gameState.GameState(currentPlayer=firstPlayer)
+    if recorder is not None:
+        recorder.startGame(state)
+    turns = 0
+    moves = 0
+    while True:
+        numbers = roll()
+        agent = agents[state.currentPlayer]
+        if agent.needsResults:
+            plays = moveGeneration.legalPlays(state, numbers)
+        else:
+            plays = [(play, None) for play in
+                     moveGeneration.legalPlayMovesForNumbers(
+                         state, moveGeneration.diceNumbers(numbers))]
+        play, result = agent.choosePlay(state, numbers, plays)
+        # The play goes through the same GameState rules the GUI board uses
+        state.applyPlay(play)
+        turns += 1
+        moves += len(play)
+        if recorder is not None:
+            recorder.roll(*numbers)
+            for start, end in play:
+                recorder.move(start, end)
+        if state.isWon():
+            record = None
+            if recorder is not None:
+                record = recorder.endGame(state.currentPlayer)
+            return GameResult(seed, state.currentPlayer, turns, moves,
+                              record)
+        if recorder is not None:
+            recorder.changeTurn()
+        state.changeTurn()
+
+
+def _playChunk(job):
+    """Worker entry point. Plays a list of seeded games and returns their
+    results. dice is None for each game to roll SeededDice of its own, or a
+    NumpyDice stream the chunk's games share, so its rolls come in large
+    blocks."""
+    agents, seeds, record, dice = job
+    recorder = gameRecord.GameEncoder() if record else None
+    return [playGame(agents, seed, recorder=recorder, dice=dice)
+            for seed in seeds]
+
+
+class SimulationStats:
+    """Running totals for a batch of simulated games. names describes the
+    agents playing red and white, and the wins are reported under them."""
+
+    def __init__(self, names=('red', 'white')):
+        self.names = names
+        self.games = 0
+        self.moves = 0
+        self.wins = [0, 0]
+        self.start = time.perf_counter()
+
+    def add(self, result):
+        """Adds a finished game to the totals."""
+        self.games += 1
+        self.moves += result.moves
+        self.wins[result.winner] += 1
+
+    def elapsed(self):
+        """Returns the seconds since the batch started."""
+        return time.perf_counter() - self.start
+
+    def gamesPerSecond(self):
+        """Returns the number of games finished per second."""
+        return self.games / max(self.elapsed(), 1e-9)
+
+    def movesPerSecond(self):
+        """Returns the number of checker moves made per second."""
+        return self.moves / max(self.elapsed(), 1e-9)
+
+    def report(self):
+        """Returns a one-line summary of the batch so far."""
+        return ('%d games (%s %d, %s %d) in %.2fs: %.0f games/sec, '
+                '%.0f moves/sec' % (self.games, self.names[0], self.wins[0],
+                                    self.names[1], self.wins[1],
+                                    self.elapsed(), self.gamesPerSecond(),
+                                    self.movesPerSecond()))
+
+
+def runSelfPlay(agents, games, processes=None, seed=0, chunkSize=50,
+                record=False, dice='seeded'):
+    """Plays games between the pair of agents across a pool of processes,
+    yielding each GameResult as soon as its chunk of games finishes. Game i
+    is seeded with seed + i, which also decides who rolls first (see
+    playGame), so a batch can be reproduced exactly. With processes=1 the
+    games are played in this process. With record, each result carries the
+    game's record bytes.
+
+    dice is 'seeded' for dice of each game's own, so any game can be
+    replayed from its seed, or 'numpy' for cheaper dice from an independent
+    stream for each chunk, so a batch can only be reproduced with the same
+    chunkSize."""
+    if dice not in diceSource.KINDS:
+        raise ValueError('unknown kind of dice %r' % dice)
+    seeds = list(range(seed, seed + games))
+    starts = range(0, games, chunkSize)
+    if dice == 'numpy':
+        streams = diceSource.NumpyDice.streams(seed, len(starts))
+    else:
+        streams = [None] * len(starts)
+    jobs = [(agents, seeds[i:i + chunkSize], record, stream)
+            for i, stream in zip(starts, streams)]
+
+    if processes == 1:
+        for job in jobs:
+            for result in _playChunk(job):
+                yield result
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        for results in pool.imap_unordered(_playChunk, jobs):
+            for result in results:
+                yield result
+
+
+def _searchAgent():
+    """Returns a 2-ply search agent. search imports this module, so it is
+    only imported when the agent is asked for."""
+    import search
+    return search.SearchAgent(maxDepth=2)
+
+
+AGENTS = {'random': RandomAgent, 'greedy': GreedyAgent,
+          'search': _searchAgent}
+
+
+def main(argv=None):
+    """Runs a self-play batch from the command line and prints the
+    throughput."""
+    parser = argparse.ArgumentParser(description='Headless backgammon '
+                                     'self-play simulation.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--red', choices=sorted(AGENTS), default='random')
+    parser.add_argument('--white', choices=sorted(AGENTS), default='random')
+    parser.add_argument('--report-every', type=int, default=0,
+                        help='print progress every N games')
+    parser.add_argument('--record', default=None,
+                        help='append the games to this game record archive')
+    parser.add_argument('--dice', choices=diceSource.KINDS, default='seeded',
+                        help='seeded dice for each game, or blocks of NumPy '
+                        'dice for each chunk of games')
+    args = parser.parse_args(argv)
+
+    agents = (AGENTS[args.red](), AGENTS[args.white]())
+    stats = SimulationStats(('%s as red' % args.red,
+                             '%s as white' % args.white))
+    writer = None
+    if args.record:
+        writer = gameRecord.GameRecordWriter(args.record)
+    for result in runSelfPlay(agents, args.games, args.processes, args.seed,
+                              record=writer is not None, dice=args.dice):
+        stats.add(result)
+        if writer is not None:
+            writer.appendGame(result.record)
+        if args.report_every and not stats.games % args.report_every:
+            print(stats.report())
+    if writer is not None:
+        writer.close()
+    print(stats.report())
+    return stats
+
+
+if __name__ == '__main__':
+    main()
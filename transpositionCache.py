@@ -0,0 +1,97 @@
+import collections
+
+# Caches for values computed from positions, such as evaluations and search
+# results, keyed by GameState.zobrist. Both caches have the same interface and
+# never hold more than a fixed number of entries.
+
+
+class LRUCache:
+    """Cache that evicts the least recently used entry when full."""
+
+    def __init__(self, maxEntries=1 << 20):
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key, depth=0):
+        """Returns the value stored for key if it was computed with a depth of
+        at least depth, or None otherwise."""
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < depth:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def store(self, key, value, depth=0):
+        """Stores value for key, evicting the oldest entry if the cache is
+        full. A deeper result already stored for key is kept."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[1] > depth:
+                self.entries.move_to_end(key)
+                return
+        elif len(self.entries) >= self.maxEntries:
+            self.entries.popitem(last=False)
+        self.entries[key] = (value, depth)
+        self.entries.move_to_end(key)
+
+    def clear(self):
+        """Removes every entry and resets the statistics."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class DepthPreferredCache:
+    """Fixed-size hash table where each key maps to one slot. A new entry
+    replaces the one in its slot unless that entry was searched deeper,
+    so expensive results survive a stream of cheap ones."""
+
+    def __init__(self, maxEntries=1 << 20):
+        self.maxEntries = maxEntries
+        self.keys = [None] * maxEntries
+        self.values = [None] * maxEntries
+        self.depths = [-1] * maxEntries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.size
+
+    def lookup(self, key, depth=0):
+        """Returns the value stored for key if it was computed with a depth of
+        at least depth, or None otherwise."""
+        slot = key % self.maxEntries
+        if self.keys[slot] != key or self.depths[slot] < depth:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.values[slot]
+
+    def store(self, key, value, depth=0):
+        """Stores value for key unless its slot holds a deeper result for a
+        different key."""
+        slot = key % self.maxEntries
+        if self.keys[slot] is None:
+            self.size += 1
+        elif self.keys[slot] != key and self.depths[slot] > depth:
+            return
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = depth
+
+    def clear(self):
+        """Removes every entry and resets the statistics."""
+        self.keys = [None] * self.maxEntries
+        self.values = [None] * self.maxEntries
+        self.depths = [-1] * self.maxEntries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0